@@ -1,5 +1,6 @@
 from os import getenv
 import asyncio
+from datetime import date
 from aiogram.types import FSInputFile
 
 from bot_instance import bot
@@ -26,8 +27,11 @@ async def search(repeat_minutes: int) -> None:
                 print(f"{tg_user=}")
                 print(f"{search=}")
                 log_row_num = await db.add_log_record(tg_user, search)
-                iins_found = await utils.find_iin_auto(
-                    iins_auto_search=task["iins_auto_search"], name=task["search_name"]
+                iins_found, iins_auto_search, last_suffix = await utils.find_iin_auto(
+                    iins_auto_search=task["iins_auto_search"],
+                    name=task["search_name"],
+                    search_date=date.fromisoformat(task["search_date"]),
+                    last_suffix=task["last_suffix"],
                 )
                 await db.update_log_record(
                     rowid=log_row_num, cache_used=0, iins_found=iins_found
@@ -54,7 +58,11 @@ async def search(repeat_minutes: int) -> None:
                         print(err)
                     await db.remove_search_task_by_rowid(rowid=task["rowid"])
                 else:
-                    await db.update_auto_search_task(rowid=task["rowid"])
+                    await db.update_auto_search_task(
+                        rowid=task["rowid"],
+                        iins_auto_search=iins_auto_search,
+                        last_suffix=last_suffix,
+                    )
         else:
             for task in auto_search_tasks:
                 await db.update_auto_search_task(rowid=task["rowid"])
@@ -63,6 +71,7 @@ async def search(repeat_minutes: int) -> None:
 
 async def send_db_archive(repeat_minutes: int) -> None:
     while True:
+        await db.checkpoint_databases()
         db.archive_db_files()
         await bot.send_document(
             chat_id=getenv("BOT_ADMIN_ID"),
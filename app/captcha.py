@@ -1,11 +1,29 @@
+import asyncio
 import base64
-from os import path
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from os import cpu_count, getenv, path
 
-import cv2
 import numpy as np
 
+MATCH_METHOD = "TM_CCORR_NORMED"
+MATCH_THRESHOLD = 0.99
+MIN_CONFIDENCE = 0.993
+CAPTCHA_LENGTHS = range(
+    int(getenv("CAPTCHA_MIN_LENGTH", 4)), int(getenv("CAPTCHA_MAX_LENGTH", 6)) + 1
+)
+POOL_BACKEND = getenv("CAPTCHA_POOL", "thread")  # "thread" or "process"
+POOL_WORKERS = int(getenv("CAPTCHA_WORKERS", min(4, cpu_count() or 1)))
+ATLAS_FILE = path.join("app", "img", "templates.npy")
+
+executor: Executor | None = None
+all_templates: list[np.ndarray] | None = None
+template_digits: np.ndarray | None = None
+template_widths: np.ndarray | None = None
+
 
 def load_all_templates() -> dict:
+    import cv2
+
     all_templates = {}
     for digit in range(10):
         for font in ("b", "i"):
@@ -18,54 +36,152 @@ def load_all_templates() -> dict:
     return all_templates
 
 
-all_templates = load_all_templates()
+def build_atlas() -> None:
+    # packs all PNG templates into one .npy file (run after changing app/img/*.png)
+    png_templates = load_all_templates()
+    height = max(tpl.shape[0] for tpl in png_templates.values())
+    width = max(tpl.shape[1] for tpl in png_templates.values())
+    atlas_dtype = np.dtype(
+        [("digit", "u1"), ("width", "u1"), ("pixels", "u1", (height, width))]
+    )
+    atlas = np.zeros(len(png_templates), dtype=atlas_dtype)
+    for i, (name, template) in enumerate(png_templates.items()):
+        atlas[i]["digit"] = int(name[0])
+        atlas[i]["width"] = template.shape[1]
+        atlas[i]["pixels"][: template.shape[0], : template.shape[1]] = template
+    np.save(ATLAS_FILE, atlas)
+
+
+def load_atlas() -> None:
+    global all_templates, template_digits, template_widths
+    atlas = np.load(ATLAS_FILE, mmap_mode="r")
+    validate_atlas(atlas)
+    templates_loaded = [
+        np.ascontiguousarray(entry["pixels"][:, : entry["width"]]) for entry in atlas
+    ]
+    template_digits = np.array(atlas["digit"], dtype=np.int8)
+    template_widths = np.array(atlas["width"], dtype=np.int32)
+    # published last: templates() checks all_templates only, and pool threads
+    # that see it set must also see the digits and widths
+    all_templates = templates_loaded
+
+
+def validate_atlas(atlas: np.ndarray) -> None:
+    if atlas.dtype.names != ("digit", "width", "pixels"):
+        raise ValueError(f"{ATLAS_FILE}: unexpected atlas format {atlas.dtype}")
+    if sorted(atlas["digit"].tolist()) != sorted(list(range(10)) * 2):
+        raise ValueError(f"{ATLAS_FILE}: atlas must hold 2 templates per digit")
+    max_width = atlas.dtype["pixels"].shape[1]
+    if not all(0 < width <= max_width for width in atlas["width"].tolist()):
+        raise ValueError(f"{ATLAS_FILE}: template width out of range")
+
+
+def templates() -> list[np.ndarray]:
+    if all_templates is None:
+        load_atlas()
+    return all_templates
+
+
+def start_pool() -> Executor:
+    global executor
+    if executor is None:
+        if POOL_BACKEND == "process":
+            executor = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+        else:
+            executor = ThreadPoolExecutor(
+                max_workers=POOL_WORKERS, thread_name_prefix="captcha"
+            )
+    return executor
+
+
+def stop_pool() -> None:
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
+
+
+async def solve(img_data: str) -> str | None:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(start_pool(), resolve_checked, img_data)
 
 
 def resolve_captcha(img_data: str) -> str:
-    img_array = b64_to_array(img_data)
-    digit_coordinates = digits_positions(img_array)
-    captcha_txt = ""
-    for _, char in sorted(digit_coordinates.items()):
-        captcha_txt += char
-    return captcha_txt
+    digits, _ = recognize(b64_to_array(img_data))
+    return digits
+
+
+def resolve_checked(img_data: str) -> str | None:
+    # None - answer is not reliable enough to be sent to NCA
+    digits, confidences = recognize(b64_to_array(img_data))
+    if is_confident(digits, confidences):
+        return digits
+    return None
+
+
+def is_confident(digits: str, confidences: list[float]) -> bool:
+    if len(digits) not in CAPTCHA_LENGTHS:
+        return False
+    return min(confidences) >= MIN_CONFIDENCE
+
+
+def recognize(img_array: np.ndarray) -> tuple[str, list[float]]:
+    scores = score_templates(gray(img_array))
+    matches = suppress_overlaps(scores)
+    digits = "".join(str(template_digits[tpl_index]) for _, tpl_index, _ in matches)
+    confidences = [float(score) for _, _, score in matches]
+    return digits, confidences
 
 
 def b64_to_array(img_b64: str) -> np.ndarray:
+    import cv2
+
     img_bytes = base64.b64decode(img_b64)
     img_buffer = np.frombuffer(img_bytes, dtype=np.uint8)
     return cv2.imdecode(img_buffer, cv2.IMREAD_UNCHANGED)
 
 
-def digits_positions(img_array: np.ndarray) -> dict:
-    digit_coordinates = {}
-    for digit in range(10):
-        digit_templates = (all_templates[f"{digit}b"], all_templates[f"{digit}i"])
-        coordinates = match_digit(digit_templates, gray(img_array))
-        for x_coord in coordinates:
-            digit_coordinates[x_coord] = str(digit)
-    return digit_coordinates
-
-
-def match_digit(
-    digit_templates: tuple[np.ndarray, np.ndarray], gray_img_array: np.ndarray
-) -> list[np.int64]:
-    # try_methods = [cv2.TM_SQDIFF_NORMED, cv2.TM_CCORR_NORMED, cv2.TM_CCOEFF_NORMED]
-    method = cv2.TM_CCORR_NORMED
-    threshhold = 0.99
-    digit_coordinates = []
-    for template in digit_templates:
+def score_templates(gray_img_array: np.ndarray) -> np.ndarray:
+    # rows - templates, columns - x positions; best score over all y positions
+    import cv2
+
+    method = getattr(cv2, MATCH_METHOD)
+    img_width = gray_img_array.shape[1]
+    scores = np.full((len(templates()), img_width), -1.0, dtype=np.float32)
+    for tpl_index, template in enumerate(templates()):
         match_array = cv2.matchTemplate(gray_img_array, template, method)
         if method in (cv2.TM_SQDIFF, cv2.TM_SQDIFF_NORMED):
-            char_positions = np.where(match_array <= 1 - threshhold)[1]
-        else:
-            char_positions = np.where(match_array >= threshhold)[1]
-        digit_coordinates.extend(char_positions)
-    return digit_coordinates
+            match_array = 1 - match_array
+        scores[tpl_index, : match_array.shape[1]] = match_array.max(axis=0)
+    return scores
+
+
+def suppress_overlaps(scores: np.ndarray) -> list[tuple[int, int, float]]:
+    # non-maximum suppression along x axis: a match is dropped if its center
+    # falls inside the template width of a better match
+    tpl_indexes, x_coords = np.nonzero(scores >= MATCH_THRESHOLD)
+    candidates = scores[tpl_indexes, x_coords]
+    taken = np.zeros(scores.shape[1], dtype=bool)
+    matches = []
+    for i in np.argsort(-candidates, kind="stable"):
+        tpl_index, x_coord = int(tpl_indexes[i]), int(x_coords[i])
+        x_end = x_coord + int(template_widths[tpl_index])
+        if taken[(x_coord + x_end) // 2]:
+            continue
+        taken[x_coord:x_end] = True
+        matches.append((x_coord, tpl_index, float(candidates[i])))
+    return sorted(matches)
 
 
 def gray(img_array: np.ndarray) -> np.ndarray:
+    import cv2
+
     img_crop = img_array[5:][:][:]
     img_bwa = cv2.threshold(img_crop, 254, 255, cv2.THRESH_BINARY)[1]
     alpha_mask = img_bwa[:, :, 3] < 255
     img_bwa[alpha_mask] = [255, 255, 255, 255]
     return cv2.cvtColor(img_bwa, cv2.COLOR_BGRA2GRAY)
+
+
+if __name__ == "__main__":
+    build_atlas()
@@ -1,100 +1,255 @@
 from os import getenv
 import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
 from pathlib import Path
+from typing import AsyncIterator
 import aiosqlite
 import ujson
 import zipfile
 
+from app.memcache import MemoryCache
+
 Path("app", "data").mkdir(exist_ok=True)
 cache_db_file = Path("app", "data", "cache.db")
 search_log_db_file = Path("app", "data", "search_log.db")
 auto_search_db_file = Path("app", "data", "auto_search.db")
 access_db_file = Path("app", "data", "access.db")
 
+# set on every pooled connection; WAL lets readers run alongside the writer
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -8000",  # KiB
+    "PRAGMA mmap_size = 67108864",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+PURGE_BATCH = 500  # rows per delete transaction
+VACUUM_PAGES = 1000  # pages per incremental vacuum step
+PURGE_PAUSE = 0.05
+
+# per database file: one writer (writes are serialized by a lock) and one reader
+writers: dict[Path, aiosqlite.Connection] = {}
+readers: dict[Path, aiosqlite.Connection] = {}
+write_locks: dict[Path, asyncio.Lock] = {}
+
+# in-memory tier of cache.db, TTLs match the cache purge jobs in app/maintenance.py;
+# entries are kept as encoded JSON, so the MB limits are the memory really used
+cache_level1 = MemoryCache(
+    max_bytes=int(getenv("MEMORY_CACHE_LEVEL1_MB", 32)) * 2**20, ttl=24 * 3600
+)
+cache_level2 = MemoryCache(
+    max_bytes=int(getenv("MEMORY_CACHE_LEVEL2_MB", 8)) * 2**20, ttl=3600
+)
+
+
+async def open_connection(db_file: Path) -> aiosqlite.Connection:
+    db_connection = await aiosqlite.connect(db_file)
+    for pragma in PRAGMAS:
+        await db_connection.execute(pragma)
+    return db_connection
+
+
+async def open_databases() -> None:
+    db_files = (cache_db_file, search_log_db_file, auto_search_db_file, access_db_file)
+    for db_file in db_files:
+        if db_file not in writers:
+            writers[db_file] = await open_connection(db_file)
+            readers[db_file] = await open_connection(db_file)
+            write_locks[db_file] = asyncio.Lock()
+
+
+async def close_databases() -> None:
+    for db_file in writers:
+        await optimize(db_file)
+    for db_connection in (*writers.values(), *readers.values()):
+        await db_connection.close()
+    writers.clear()
+    readers.clear()
+    write_locks.clear()
+
+
+@asynccontextmanager
+async def writing(db_file: Path) -> AsyncIterator[aiosqlite.Connection]:
+    async with write_locks[db_file]:
+        db_connection = writers[db_file]
+        try:
+            yield db_connection
+        except BaseException:
+            # the connection outlives the call: never leave a transaction open
+            await db_connection.rollback()
+            raise
+
+
+@asynccontextmanager
+async def reading(db_file: Path) -> AsyncIterator[aiosqlite.Connection]:
+    yield readers[db_file]
+
+
+async def checkpoint_databases() -> None:
+    # moves WAL contents into the main files, e.g. before they are archived
+    for db_file in writers:
+        async with writing(db_file) as db_connection:
+            await db_connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+# schema steps per database: applying step n sets PRAGMA user_version to n + 1;
+# released steps must never change, schema changes go into a new step
+CACHE_MIGRATIONS = [
+    (
+        """CREATE TABLE IF NOT EXISTS level_1 (
+            when_created TEXT NOT NULL,
+            search_date TEXT NOT NULL,
+            digit_8th INTEGER NOT NULL,
+            iins_postkz TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS level_2 (
+            when_created TEXT NOT NULL,
+            search_date TEXT NOT NULL,
+            search_name TEXT NOT NULL,
+            digit_8th INTEGER NOT NULL,
+            iins_found TEXT,
+            iins_auto_search TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS frontier (
+            when_changed TEXT NOT NULL,
+            search_date TEXT NOT NULL,
+            digit_8th INTEGER NOT NULL,
+            last_suffix INTEGER NOT NULL,
+            PRIMARY KEY (search_date, digit_8th)
+        )""",
+        """CREATE TABLE IF NOT EXISTS postkz_names (
+            iin TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            kgd_date TEXT,
+            when_created TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS nca_owners (
+            iin TEXT PRIMARY KEY,
+            last_name TEXT,
+            first_name TEXT,
+            middle_name TEXT,
+            when_created TEXT NOT NULL
+        )""",
+    ),
+    (
+        """CREATE INDEX IF NOT EXISTS level_1_search
+            ON level_1 (search_date, digit_8th)""",
+        """CREATE INDEX IF NOT EXISTS level_1_created ON level_1 (when_created)""",
+        """CREATE INDEX IF NOT EXISTS level_2_search
+            ON level_2 (search_date, search_name, digit_8th)""",
+        """CREATE INDEX IF NOT EXISTS level_2_created ON level_2 (when_created)""",
+    ),
+]
+SEARCH_LOG_MIGRATIONS = [
+    (
+        """CREATE TABLE IF NOT EXISTS searches (
+            date_time TEXT NOT NULL,
+            tg_id INTEGER NOT NULL,
+            tg_nick TEXT,
+            tg_name TEXT,
+            search_date TEXT NOT NULL,
+            search_name TEXT NOT NULL,
+            digit_8th INTEGER NOT NULL,
+            auto_search INTEGER NOT NULL,
+            cache_used INTEGER,
+            found_count INTEGER,
+            found_iins TEXT
+        )""",
+    ),
+    (
+        """CREATE INDEX IF NOT EXISTS searches_user ON searches (tg_id, date_time)""",
+        """CREATE INDEX IF NOT EXISTS searches_date_time ON searches (date_time)""",
+    ),
+]
+AUTO_SEARCH_MIGRATIONS = [
+    (
+        """CREATE TABLE IF NOT EXISTS search_tasks (
+            when_created TEXT NOT NULL,
+            tg_id INTEGER NOT NULL,
+            tg_nick TEXT,
+            tg_name TEXT,
+            search_date TEXT NOT NULL,
+            search_name TEXT NOT NULL,
+            iins_auto_search TEXT,
+            when_changed TEXT
+        )""",
+    ),
+    (
+        """CREATE INDEX IF NOT EXISTS search_tasks_changed
+            ON search_tasks (when_changed)""",
+        """CREATE INDEX IF NOT EXISTS search_tasks_user ON search_tasks (tg_id)""",
+        """CREATE INDEX IF NOT EXISTS search_tasks_created
+            ON search_tasks (when_created)""",
+    ),
+    ("""ALTER TABLE search_tasks ADD COLUMN last_suffix INTEGER""",),
+]
+ACCESS_MIGRATIONS = [
+    (
+        """CREATE TABLE IF NOT EXISTS white_list (
+            when_changed TEXT NOT NULL,
+            tg_id INTEGER NOT NULL,
+            tg_nick TEXT,
+            tg_name TEXT,
+            expires TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS black_list (
+            when_changed TEXT NOT NULL,
+            tg_id INTEGER NOT NULL,
+            tg_nick TEXT,
+            tg_name TEXT,
+            expires TEXT NOT NULL
+        )""",
+    ),
+    (
+        """CREATE INDEX IF NOT EXISTS white_list_user ON white_list (tg_id)""",
+        """CREATE INDEX IF NOT EXISTS black_list_user ON black_list (tg_id)""",
+    ),
+]
+
+
+async def migrate(db_file: Path, migrations: list[tuple[str, ...]]) -> None:
+    async with writing(db_file) as db_connection:
+        cursor = await db_connection.execute("PRAGMA user_version")
+        (version,) = await cursor.fetchone()
+        for version, statements in enumerate(migrations[version:], start=version + 1):
+            # a step and its version number are committed together
+            await db_connection.execute("BEGIN")
+            for statement in statements:
+                await db_connection.execute(statement)
+            await db_connection.execute(f"PRAGMA user_version = {version}")
+            await db_connection.commit()
+            print(f"{db_file.name}: schema version {version}")
+
+
+async def use_incremental_vacuum(db_file: Path) -> None:
+    async with writing(db_file) as db_connection:
+        cursor = await db_connection.execute("PRAGMA auto_vacuum")
+        (auto_vacuum,) = await cursor.fetchone()
+        if auto_vacuum != 2:  # INCREMENTAL
+            # an existing database is switched by one full VACUUM
+            await db_connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await db_connection.execute("VACUUM")
+            print(f"{db_file.name}: incremental vacuum enabled")
+
 
 async def create_databases() -> None:
-    if not cache_db_file.exists():  # cache database
-        async with aiosqlite.connect(cache_db_file) as db_connection:
-            cursor = await db_connection.cursor()
-            await cursor.execute(
-                """CREATE TABLE IF NOT EXISTS level_1 (
-                    when_created TEXT NOT NULL,
-                    search_date TEXT NOT NULL,
-                    digit_8th INTEGER NOT NULL,
-                    iins_postkz TEXT
-                )"""
-            )
-            await cursor.execute(
-                """CREATE TABLE IF NOT EXISTS level_2 (
-                    when_created TEXT NOT NULL,
-                    search_date TEXT NOT NULL,
-                    search_name TEXT NOT NULL,
-                    digit_8th INTEGER NOT NULL,
-                    iins_found TEXT,
-                    iins_auto_search TEXT
-                )"""
-            )
-    if not search_log_db_file.exists():  # search log database
-        async with aiosqlite.connect(search_log_db_file) as db_connection:
-            cursor = await db_connection.cursor()
-            await cursor.execute(
-                """CREATE TABLE IF NOT EXISTS searches (
-                    date_time TEXT NOT NULL,
-                    tg_id INTEGER NOT NULL,
-                    tg_nick TEXT,
-                    tg_name TEXT,
-                    search_date TEXT NOT NULL,
-                    search_name TEXT NOT NULL,
-                    digit_8th INTEGER NOT NULL,
-                    auto_search INTEGER NOT NULL,
-                    cache_used INTEGER,
-                    found_count INTEGER,
-                    found_iins TEXT
-                )"""
-            )
-    if not auto_search_db_file.exists():  # auto search database
-        async with aiosqlite.connect(auto_search_db_file) as db_connection:
-            cursor = await db_connection.cursor()
-            await cursor.execute(
-                """CREATE TABLE IF NOT EXISTS search_tasks (
-                    when_created TEXT NOT NULL,
-                    tg_id INTEGER NOT NULL,
-                    tg_nick TEXT,
-                    tg_name TEXT,
-                    search_date TEXT NOT NULL,
-                    search_name TEXT NOT NULL,
-                    iins_auto_search TEXT,
-                    when_changed TEXT
-                )"""
-            )
-    if not access_db_file.exists():  # access database
-        async with aiosqlite.connect(access_db_file) as db_connection:
-            cursor = await db_connection.cursor()
-            await cursor.execute(
-                """CREATE TABLE IF NOT EXISTS white_list (
-                    when_changed TEXT NOT NULL,
-                    tg_id INTEGER NOT NULL,
-                    tg_nick TEXT,
-                    tg_name TEXT,
-                    expires TEXT NOT NULL
-                )"""
-            )
-            await cursor.execute(
-                """CREATE TABLE IF NOT EXISTS black_list (
-                    when_changed TEXT NOT NULL,
-                    tg_id INTEGER NOT NULL,
-                    tg_nick TEXT,
-                    tg_name TEXT,
-                    expires TEXT NOT NULL
-                )"""
-            )
+    # needs open_databases() first; brings every database to the latest schema
+    await migrate(cache_db_file, CACHE_MIGRATIONS)
+    await migrate(search_log_db_file, SEARCH_LOG_MIGRATIONS)
+    await migrate(auto_search_db_file, AUTO_SEARCH_MIGRATIONS)
+    await migrate(access_db_file, ACCESS_MIGRATIONS)
+    for db_file in writers:
+        await use_incremental_vacuum(db_file)
 
 
 async def access_level(tg_id: int) -> str:
     if tg_id == int(getenv("BOT_ADMIN_ID")):
         return "admin"
 
-    async with aiosqlite.connect(access_db_file) as db_connection:
+    async with reading(access_db_file) as db_connection:
         cursor = await db_connection.cursor()
         await cursor.execute(
             """SELECT * FROM black_list
@@ -136,66 +291,239 @@ async def access_level(tg_id: int) -> str:
 
 
 async def write_cache(cache_level: int, cache_data: dict) -> None:
-    async with aiosqlite.connect(cache_db_file) as db_connection:
+    search_date = f"{cache_data["search_date"]:%Y-%m-%d}"
+    async with writing(cache_db_file) as db_connection:
         cursor = await db_connection.cursor()
         if cache_level == 1:
+            iins_postkz = ujson.dumps(cache_data["iins_postkz"], ensure_ascii=False)
             await cursor.execute(
                 "INSERT INTO level_1 VALUES (datetime('now'), ?, ?, ?)",
-                (
-                    f"{cache_data["search_date"]:%Y-%m-%d}",
-                    cache_data["digit_8th"],
-                    ujson.dumps(cache_data["iins_postkz"], ensure_ascii=False),
-                ),
+                (search_date, cache_data["digit_8th"], iins_postkz),
             )
             await db_connection.commit()
+            iins_postkz = iins_postkz.encode()
+            cache_level1.put(
+                (search_date, cache_data["digit_8th"]), iins_postkz, len(iins_postkz)
+            )
         elif cache_level == 2:
+            iins_found = ujson.dumps(cache_data["iins_found"], ensure_ascii=False)
+            iins_auto_search = ujson.dumps(
+                cache_data["iins_auto_search"], ensure_ascii=False
+            )
             await cursor.execute(
                 "INSERT INTO level_2 VALUES (datetime('now'), ?, ?, ?, ?, ?)",
                 (
-                    f"{cache_data["search_date"]:%Y-%m-%d}",
+                    search_date,
                     cache_data["search_name"],
                     cache_data["digit_8th"],
-                    ujson.dumps(cache_data["iins_found"], ensure_ascii=False),
-                    ujson.dumps(cache_data["iins_auto_search"], ensure_ascii=False),
+                    iins_found,
+                    iins_auto_search,
                 ),
             )
             await db_connection.commit()
+            put_level2(
+                (search_date, cache_data["search_name"], cache_data["digit_8th"]),
+                iins_found,
+                iins_auto_search,
+            )
 
 
 async def read_cache(search_date: str, search_name: str, digit_8th: int):
-    cache_used = 0
-    cached_data = None
-    async with aiosqlite.connect(cache_db_file) as db_connection:
+    # memory tier first, then cache.db; level 2 always wins over level 1
+    search_date = f"{search_date}"
+    level2_key = (search_date, search_name, digit_8th)
+    level1_key = (search_date, digit_8th)
+    # decoded on every hit: each caller gets own IIN dicts to update in place
+    if (cached_data := cache_level2.get(level2_key)) is not None:
+        return 2, (ujson.loads(cached_data[0]), ujson.loads(cached_data[1]))
+    async with reading(cache_db_file) as db_connection:
         cursor = await db_connection.cursor()
         await cursor.execute(
-            """SELECT iins_found, iins_auto_search FROM level_2
+            """SELECT iins_found, iins_auto_search,
+                CAST(strftime('%s', when_created) AS INTEGER)
+                FROM level_2
                 WHERE search_date == ?
                 AND search_name == ?
                 AND digit_8th == ?
             """,
-            (search_date, search_name, digit_8th),
+            level2_key,
         )
         db_data = await cursor.fetchone()
         if db_data:
-            cache_used = 2
-            cached_data = ujson.loads(db_data[0]), ujson.loads(db_data[1])
-        else:
+            put_level2(level2_key, db_data[0], db_data[1], created=db_data[2])
+            return 2, (ujson.loads(db_data[0]), ujson.loads(db_data[1]))
+        if (cached_data := cache_level1.get(level1_key)) is not None:
+            return 1, ujson.loads(cached_data)
+        await cursor.execute(
+            """SELECT iins_postkz, CAST(strftime('%s', when_created) AS INTEGER)
+                FROM level_1
+                WHERE search_date == ?
+                AND digit_8th == ?
+            """,
+            level1_key,
+        )
+        db_data = await cursor.fetchone()
+        if db_data:
+            iins_postkz = db_data[0].encode()
+            cache_level1.put(
+                level1_key, iins_postkz, len(iins_postkz), created=db_data[1]
+            )
+            return 1, ujson.loads(iins_postkz)
+    return 0, None
+
+
+async def has_cache_level1(search_date: date, digit_8th: int) -> bool:
+    # presence check for prefetches: does not count as a cache hit or miss
+    search_date = f"{search_date}"
+    if cache_level1.contains((search_date, digit_8th)):
+        return True
+    async with reading(cache_db_file) as db_connection:
+        cursor = await db_connection.execute(
+            """SELECT 1 FROM level_1
+                WHERE search_date == ?
+                AND digit_8th == ?
+            """,
+            (search_date, digit_8th),
+        )
+        return await cursor.fetchone() is not None
+
+
+def put_level2(
+    key: tuple, iins_found: str, iins_auto_search: str, created: float | None = None
+) -> None:
+    cached_data = iins_found.encode(), iins_auto_search.encode()
+    size = len(cached_data[0]) + len(cached_data[1])
+    cache_level2.put(key, cached_data, size, created=created)
+
+
+def cache_stats() -> dict:
+    return {"level_1": cache_level1.stats(), "level_2": cache_level2.stats()}
+
+
+async def invalidate_cache(search_date: str | None = None) -> tuple[int, int]:
+    # drops cached searches for one birth date (all if None) from both tiers;
+    # returns (memory entries, cache.db rows) removed
+    def match(key: tuple) -> bool:
+        return search_date is None or key[0] == search_date
+
+    memory_removed = cache_level1.invalidate(match) + cache_level2.invalidate(match)
+    db_removed = 0
+    async with writing(cache_db_file) as db_connection:
+        for table in ("level_1", "level_2"):
+            if search_date is None:
+                cursor = await db_connection.execute(f"DELETE FROM {table}")
+            else:
+                cursor = await db_connection.execute(
+                    f"DELETE FROM {table} WHERE search_date == ?", (search_date,)
+                )
+            db_removed += cursor.rowcount
+        await db_connection.commit()
+    return memory_removed, db_removed
+
+
+async def write_frontier(search_date: date, digit_8th: int, last_suffix: int) -> None:
+    async with writing(cache_db_file) as db_connection:
+        cursor = await db_connection.cursor()
+        await cursor.execute(
+            """INSERT OR REPLACE INTO frontier VALUES (datetime('now'), ?, ?, ?)""",
+            (f"{search_date:%Y-%m-%d}", digit_8th, last_suffix),
+        )
+        await db_connection.commit()
+
+
+async def read_frontier(search_date: date, digit_8th: int) -> int | None:
+    # last issued suffix; however old, it is still a lower bound
+    async with reading(cache_db_file) as db_connection:
+        cursor = await db_connection.cursor()
+        await cursor.execute(
+            """SELECT last_suffix FROM frontier
+                WHERE search_date == ?
+                AND digit_8th == ?
+            """,
+            (f"{search_date:%Y-%m-%d}", digit_8th),
+        )
+        db_data = await cursor.fetchone()
+    if db_data:
+        return db_data[0]
+    return None
+
+
+async def read_postkz_names(iins: list[str]) -> dict[str, dict]:
+    # names from KGD base never expire: an IIN once named keeps its name
+    postkz_names = {}
+    async with reading(cache_db_file) as db_connection:
+        cursor = await db_connection.cursor()
+        for i in range(0, len(iins), 500):
+            iins_chunk = iins[i : i + 500]
             await cursor.execute(
-                """SELECT iins_postkz FROM level_1
-                    WHERE search_date == ?
-                    AND digit_8th == ?
-                """,
-                (search_date, digit_8th),
+                f"""SELECT iin, name, kgd_date FROM postkz_names
+                    WHERE iin IN ({", ".join("?" * len(iins_chunk))})""",
+                iins_chunk,
             )
-            db_data = await cursor.fetchone()
-            if db_data:
-                cache_used = 1
-                cached_data = ujson.loads(db_data[0])
-    return cache_used, cached_data
+            for iin, name, kgd_date in await cursor.fetchall():
+                postkz_names[iin] = {"name": name, "kgd_date": kgd_date}
+    return postkz_names
+
+
+async def write_postkz_names(iins_postkz: list[dict]) -> None:
+    iins_named = [
+        (iin["iin"], iin["name"], iin["kgd_date"])
+        for iin in iins_postkz
+        if iin["name"]
+    ]
+    if not iins_named:
+        return None
+    async with writing(cache_db_file) as db_connection:
+        cursor = await db_connection.cursor()
+        await cursor.executemany(
+            """INSERT OR IGNORE INTO postkz_names
+                VALUES (?, ?, ?, datetime('now'))""",
+            iins_named,
+        )
+        await db_connection.commit()
+
+
+async def read_nca_owners(iins: list[str]) -> dict[str, dict]:
+    # IIN owners from GBD FL (via NCA) never change once assigned
+    nca_owners = {}
+    async with reading(cache_db_file) as db_connection:
+        cursor = await db_connection.cursor()
+        for i in range(0, len(iins), 500):
+            iins_chunk = iins[i : i + 500]
+            await cursor.execute(
+                f"""SELECT iin, last_name, first_name, middle_name FROM nca_owners
+                    WHERE iin IN ({", ".join("?" * len(iins_chunk))})""",
+                iins_chunk,
+            )
+            for iin, last_name, first_name, middle_name in await cursor.fetchall():
+                nca_owners[iin] = {
+                    "last_name": last_name,
+                    "first_name": first_name,
+                    "middle_name": middle_name,
+                }
+    return nca_owners
+
+
+async def write_nca_owners(iins_nca: list[dict]) -> None:
+    iins_owned = [
+        (iin["iin"], iin["last_name"], iin["first_name"], iin["middle_name"])
+        for iin in iins_nca
+        if iin.get("nca_status") == "found"
+    ]
+    if not iins_owned:
+        return None
+    async with writing(cache_db_file) as db_connection:
+        cursor = await db_connection.cursor()
+        await cursor.executemany(
+            """INSERT OR IGNORE INTO nca_owners
+                VALUES (?, ?, ?, ?, datetime('now'))""",
+            iins_owned,
+        )
+        await db_connection.commit()
 
 
 async def add_log_record(tg_user: dict, search: dict) -> int:
-    async with aiosqlite.connect(search_log_db_file) as db_connection:
+    async with writing(search_log_db_file) as db_connection:
         cursor = await db_connection.cursor()
         await cursor.execute(
             """INSERT INTO searches (
@@ -225,7 +553,7 @@ async def add_log_record(tg_user: dict, search: dict) -> int:
 async def update_log_record(
     rowid: int, cache_used: int, iins_found: list[dict]
 ) -> None:
-    async with aiosqlite.connect(search_log_db_file) as db_connection:
+    async with writing(search_log_db_file) as db_connection:
         cursor = await db_connection.cursor()
         await cursor.execute(
             """UPDATE searches SET cache_used = ?, found_count = ?, found_iins = ?
@@ -240,52 +568,51 @@ async def update_log_record(
         await db_connection.commit()
 
 
-async def cleanup_log_db(repeat_minutes: int) -> None:
+async def purge_rows(db_file: Path, table: str, column: str, max_age: str) -> int:
+    # deletes rows older than max_age (e.g. "-1 hour") in batches, each batch in
+    # its own transaction: searches waiting to log get the writer in between
+    purged = 0
     while True:
-        async with aiosqlite.connect(search_log_db_file) as db_connection:
-            cursor = await db_connection.cursor()
-            await cursor.execute(
-                "DELETE FROM searches WHERE date_time < datetime('now', '-90 days')"
+        async with writing(db_file) as db_connection:
+            cursor = await db_connection.execute(
+                f"""DELETE FROM {table} WHERE rowid IN (
+                    SELECT rowid FROM {table}
+                    WHERE {column} < datetime('now', ?)
+                    LIMIT ?
+                )""",
+                (max_age, PURGE_BATCH),
             )
             await db_connection.commit()
-        await asyncio.sleep(repeat_minutes * 60)
+        purged += cursor.rowcount
+        if cursor.rowcount < PURGE_BATCH:
+            return purged
+        await asyncio.sleep(PURGE_PAUSE)
 
 
-async def cleanup_cache_level1(repeat_minutes: int) -> None:
+async def vacuum_incrementally(db_file: Path) -> int:
+    # returns free pages given back to the file system, a batch at a time
+    freed = 0
     while True:
-        async with aiosqlite.connect(cache_db_file) as db_connection:
-            cursor = await db_connection.cursor()
-            await cursor.execute(
-                "DELETE FROM level_1 WHERE when_created < datetime('now', '-1 day')"
+        async with writing(db_file) as db_connection:
+            cursor = await db_connection.execute("PRAGMA freelist_count")
+            (free_pages,) = await cursor.fetchone()
+            if not free_pages:
+                return freed
+            # executescript steps the pragma to the end, execute frees one page
+            await db_connection.executescript(
+                f"PRAGMA incremental_vacuum({VACUUM_PAGES})"
             )
-            await db_connection.commit()
-        await asyncio.sleep(repeat_minutes * 60)
+        freed += min(free_pages, VACUUM_PAGES)
+        await asyncio.sleep(PURGE_PAUSE)
 
 
-async def cleanup_cache_level2(repeat_minutes: int) -> None:
-    while True:
-        async with aiosqlite.connect(cache_db_file) as db_connection:
-            cursor = await db_connection.cursor()
-            await cursor.execute(
-                "DELETE FROM level_2 WHERE when_created < datetime('now', '-1 hour')"
-            )
-            await db_connection.commit()
-        await asyncio.sleep(repeat_minutes * 60)
-
-
-async def cleanup_auto_search_db(repeat_minutes: int) -> None:
-    while True:
-        async with aiosqlite.connect(auto_search_db_file) as db_connection:
-            cursor = await db_connection.cursor()
-            await cursor.execute(
-                "DELETE FROM search_tasks WHERE when_created < datetime('now', '-30 days')"
-            )
-            await db_connection.commit()
-        await asyncio.sleep(repeat_minutes * 60)
+async def optimize(db_file: Path) -> None:
+    async with writing(db_file) as db_connection:
+        await db_connection.execute("PRAGMA optimize")
 
 
 async def get_log_by_tgid(tg_id: int) -> int:
-    async with aiosqlite.connect(search_log_db_file) as db_connection:
+    async with reading(search_log_db_file) as db_connection:
         cursor = await db_connection.cursor()
         await cursor.execute(
             """SELECT COUNT(*), datetime(date_time, '+7 days', '+3 hours')
@@ -303,7 +630,7 @@ async def get_log_by_tgid(tg_id: int) -> int:
 
 
 async def add_auto_search_task(tg_user: dict, search: dict) -> None:
-    async with aiosqlite.connect(auto_search_db_file) as db_connection:
+    async with writing(auto_search_db_file) as db_connection:
         cursor = await db_connection.cursor()
         await cursor.execute(
             """INSERT INTO search_tasks (
@@ -314,8 +641,9 @@ async def add_auto_search_task(tg_user: dict, search: dict) -> None:
                 search_date,
                 search_name,
                 iins_auto_search,
-                when_changed
-            ) VALUES (datetime("now"), ?, ?, ?, ?, ?, ?, datetime("now"))""",
+                when_changed,
+                last_suffix
+            ) VALUES (datetime("now"), ?, ?, ?, ?, ?, ?, datetime("now"), ?)""",
             (
                 tg_user["id"],
                 tg_user["nick"],
@@ -323,38 +651,52 @@ async def add_auto_search_task(tg_user: dict, search: dict) -> None:
                 f"{search["date"]:%Y-%m-%d}",
                 search["name"],
                 ujson.dumps(search["iins_auto_search"], ensure_ascii=False),
+                search["last_suffix"],
             ),
         )
         await db_connection.commit()
 
 
-async def update_auto_search_task(rowid: int) -> None:
-    async with aiosqlite.connect(auto_search_db_file) as db_connection:
+async def update_auto_search_task(
+    rowid: int,
+    iins_auto_search: list[dict] | None = None,
+    last_suffix: int | None = None,
+) -> None:
+    async with writing(auto_search_db_file) as db_connection:
         cursor = await db_connection.cursor()
-        await cursor.execute(
-            """UPDATE search_tasks SET when_changed == datetime('now')
-                WHERE rowid == ?""",
-            (rowid,),
-        )
+        if iins_auto_search is None:
+            await cursor.execute(
+                """UPDATE search_tasks SET when_changed == datetime('now')
+                    WHERE rowid == ?""",
+                (rowid,),
+            )
+        else:
+            await cursor.execute(
+                """UPDATE search_tasks SET when_changed == datetime('now'),
+                    iins_auto_search = ?,
+                    last_suffix = ?
+                    WHERE rowid == ?""",
+                (ujson.dumps(iins_auto_search, ensure_ascii=False), last_suffix, rowid),
+            )
         await db_connection.commit()
 
 
 async def remove_search_task_by_rowid(rowid: int) -> None:
-    async with aiosqlite.connect(auto_search_db_file) as db_connection:
+    async with writing(auto_search_db_file) as db_connection:
         cursor = await db_connection.cursor()
         await cursor.execute("DELETE FROM search_tasks WHERE rowid == ?", (rowid,))
         await db_connection.commit()
 
 
 async def remove_user_search_tasks(tg_id: int) -> None:
-    async with aiosqlite.connect(auto_search_db_file) as db_connection:
+    async with writing(auto_search_db_file) as db_connection:
         cursor = await db_connection.cursor()
         await cursor.execute("DELETE FROM search_tasks WHERE tg_id == ?", (tg_id,))
         await db_connection.commit()
 
 
 async def get_tasks_by_tgid(tg_id: int) -> list[dict]:
-    async with aiosqlite.connect(auto_search_db_file) as db_connection:
+    async with reading(auto_search_db_file) as db_connection:
         cursor = await db_connection.cursor()
         await cursor.execute(
             """SELECT when_created, tg_id, search_date, search_name, when_changed
@@ -373,10 +715,11 @@ async def get_tasks_by_tgid(tg_id: int) -> list[dict]:
 
 
 async def get_tasks_by_time() -> list[dict]:
-    async with aiosqlite.connect(auto_search_db_file) as db_connection:
+    async with reading(auto_search_db_file) as db_connection:
         cursor = await db_connection.cursor()
         await cursor.execute(
-            """SELECT rowid, tg_id, tg_nick, tg_name, search_date, search_name, iins_auto_search
+            """SELECT rowid, tg_id, tg_nick, tg_name, search_date, search_name, iins_auto_search,
+                last_suffix
                 FROM search_tasks WHERE when_changed < datetime('now', '-4 hours')
                 ORDER BY when_changed
             """
@@ -391,6 +734,7 @@ async def get_tasks_by_time() -> list[dict]:
                 "search_date": row[4],
                 "search_name": row[5],
                 "iins_auto_search": ujson.loads(row[6]),
+                "last_suffix": row[7],
             }
             for row in matching_rows
         ]
@@ -3,7 +3,7 @@ from pathlib import Path
 from random import randint
 
 from aiogram import Router, F
-from aiogram.filters import CommandStart
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import (
@@ -15,6 +15,7 @@ from aiogram.types import (
 )
 
 from app import constants, utils, pdf_generator, databases as db, keyboards as kb
+from app.progress import SearchProgress
 
 
 class BotStatus(StatesGroup):
@@ -60,6 +61,40 @@ async def start_handler(message: Message, state: FSMContext) -> None:
     await state.set_state(BotStatus.input_birth_date)
 
 
+@router.message(Command("cache"))
+async def cache_handler(message: Message, command: CommandObject) -> None:
+    # admin only: /cache - memory tier stats, /cache clear [YYYY-MM-DD] - invalidate
+    if await db.access_level(message.chat.id) != "admin":
+        await default_handler(message)
+        return None
+    args = (command.args or "").split()
+    if args[:1] == ["clear"]:
+        search_date = args[1] if len(args) > 1 else None
+        try:
+            if search_date:
+                search_date = f"{date.fromisoformat(search_date)}"
+        except ValueError as date_error:
+            await message.reply(text=f"⚠️ Дата указана некорректно\n({date_error})")
+            return None
+        memory_removed, db_removed = await db.invalidate_cache(search_date)
+        text = (
+            f"🗑 <b>Кэш очищен</b> ({search_date or 'все даты'})\n"
+            f"Удалено: {memory_removed} в памяти, {db_removed} в cache.db"
+        )
+    else:
+        text = "📊 <b>Кэш в памяти</b>"
+        for level, stats in db.cache_stats().items():
+            hit_ratio = stats["hit_ratio"]
+            hit_ratio = "-" if hit_ratio is None else f"{hit_ratio:.1%}"
+            text += (
+                f"\n\n<b>{level}:</b> {stats['entries']} записей, "
+                f"{stats['bytes'] / 2**20:.1f}/{stats['max_bytes'] / 2**20:.0f} МБ\n"
+                f"попадания {stats['hits']}, промахи {stats['misses']} ({hit_ratio}), "
+                f"вытеснено {stats['evictions']}"
+            )
+    await message.answer(text=text)
+
+
 @router.message(F.text, BotStatus.input_birth_date)
 async def date_handler(message: Message, state: FSMContext) -> None:
     try:
@@ -93,10 +128,12 @@ async def name_handler(message: Message, state: FSMContext) -> None:
         "🤖🔎 Начал поиск ИИН со следующими параметрами:\n\n"
         f"<b>◦ ИИН:</b> {data['birth_date']:%y%m%d}05xxxx\n"
         f"<b>◦ Имя:</b> {str.title(data['name'])}\n"
-        f"<b>◦ Дата рождения:</b> {data['birth_date']}\n\n"
-        "Ждите завершения поиска (несколько секунд)... ⏱️"
+        f"<b>◦ Дата рождения:</b> {data['birth_date']}"
     )
-    await message.answer(text=text)
+    status_message = await message.answer(
+        text=f"{text}\n\nЖдите завершения поиска (несколько секунд)... ⏱️"
+    )
+    progress = SearchProgress(message=status_message, header=text)
     await message.chat.do(action="typing")
     tg_first_name = message.from_user.first_name
     tg_last_name = message.from_user.last_name
@@ -112,9 +149,17 @@ async def name_handler(message: Message, state: FSMContext) -> None:
         "auto": 0,
     }
     log_row_num = await db.add_log_record(tg_user, search)
-    cache_used, iins_found, iins_auto_search = await utils.find_iin(
-        birth_date=data["birth_date"], name=data["name"], digit_8th=5
-    )
+    utils.prefetch_deep_search(data["birth_date"], iins_found=None)
+    try:
+        cache_used, iins_found, iins_auto_search = await utils.find_iin(
+            birth_date=data["birth_date"],
+            name=data["name"],
+            digit_8th=5,
+            progress=progress,
+        )
+    finally:
+        await progress.close()
+    utils.prefetch_deep_search(data["birth_date"], iins_found=iins_found)
     await db.update_log_record(
         rowid=log_row_num, cache_used=cache_used, iins_found=iins_found
     )
@@ -169,10 +214,12 @@ async def callback_deep_search(callback: CallbackQuery, state: FSMContext) -> No
             "🤖🔎 Дополнительно ищу (среди более старых ИИН):\n\n"
             f"<b>◦ ИИН:</b> {data['birth_date']:%y%m%d}00xxxx\n"
             f"<b>◦ Имя:</b> {str.title(data['name'])}\n"
-            f"<b>◦ Дата рождения</b>: {data['birth_date']}\n\n"
-            "Ждите завершения поиска (несколько секунд)... ⏱️"
+            f"<b>◦ Дата рождения</b>: {data['birth_date']}"
+        )
+        status_message = await callback.message.answer(
+            text=f"{text}\n\nЖдите завершения поиска (несколько секунд)... ⏱️"
         )
-        await callback.message.answer(text=text)
+        progress = SearchProgress(message=status_message, header=text)
         await callback.message.chat.do(action="typing")
         tg_first_name = callback.from_user.first_name
         tg_last_name = callback.from_user.last_name
@@ -188,9 +235,15 @@ async def callback_deep_search(callback: CallbackQuery, state: FSMContext) -> No
             "auto": 0,
         }
         row_num = await db.add_log_record(tg_user, search)
-        cache_used, iins_found, _ = await utils.find_iin(
-            birth_date=data["birth_date"], name=data["name"], digit_8th=0
-        )
+        try:
+            cache_used, iins_found, _ = await utils.find_iin(
+                birth_date=data["birth_date"],
+                name=data["name"],
+                digit_8th=0,
+                progress=progress,
+            )
+        finally:
+            await progress.close()
         await db.update_log_record(
             rowid=row_num, cache_used=cache_used, iins_found=iins_found
         )
@@ -247,6 +300,9 @@ async def callback_auto_search(callback: CallbackQuery, state: FSMContext) -> No
             "date": data["birth_date"],
             "name": data["name"],
             "iins_auto_search": data["iins_auto_search"],
+            "last_suffix": await utils.auto_search_start(
+                data["birth_date"], data["iins_auto_search"]
+            ),
         }
         await db.add_auto_search_task(tg_user=tg_user, search=search)
         text, reply_markup = await set_auto_search_msg(callback.from_user.id, state)
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+
+class AdaptiveLimiter:
+    # AIMD concurrency limit shared by all searches: the limit grows by ~1 per
+    # window of fast successful responses and is halved on errors/slow responses
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_target: float,
+        backoff: float = 0.5,
+        background_share: float = 0.25,
+    ) -> None:
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.background_share = background_share
+        self.in_flight = 0
+        self.waiting = 0  # foreground callers waiting for a slot
+        self.last_backoff = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self, priority: dict | None = None) -> float:
+        # priority {"background": True} (e.g. a prefetch) yields to everyone else;
+        # the flag is re-read while waiting, so a caller can be promoted
+        foreground = not (priority and priority["background"])
+        async with self.condition:
+            self.waiting += foreground
+            try:
+                await self.condition.wait_for(lambda: self.can_start(priority))
+            finally:
+                self.waiting -= foreground
+            self.in_flight += 1
+        return time.monotonic()
+
+    def can_start(self, priority: dict | None) -> bool:
+        if not (priority and priority["background"]):
+            return self.in_flight < int(self.limit)
+        # background: only while no one else waits, within a share of the limit
+        background_limit = max(1, int(self.limit * self.background_share))
+        return not self.waiting and self.in_flight < background_limit
+
+    async def release(self, started: float, success: bool | None) -> None:
+        # success None - the call was cancelled and says nothing about upstream
+        latency = time.monotonic() - started
+        if success and latency <= self.latency_target:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif (
+            success is not None
+            and time.monotonic() - self.last_backoff > self.latency_target
+        ):
+            # one decrease per latency window, not one per failed request
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+            self.last_backoff = time.monotonic()
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+        }
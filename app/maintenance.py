@@ -0,0 +1,98 @@
+import asyncio
+import random
+import time
+
+from app import databases as db
+
+JITTER = 0.1  # share of a job interval
+
+
+async def vacuum_and_optimize() -> int:
+    freed = 0
+    for db_file in list(db.writers):
+        freed += await db.vacuum_incrementally(db_file)
+        await db.optimize(db_file)
+    return freed
+
+
+# database files are looked up at call time: they can be redirected (replay)
+JOBS = [
+    {
+        "name": "purge level_2",
+        "minutes": 1,
+        "unit": "rows",
+        "run": lambda: db.purge_rows(
+            db.cache_db_file, "level_2", "when_created", "-1 hour"
+        ),
+    },
+    {
+        "name": "purge level_1",
+        "minutes": 10,
+        "unit": "rows",
+        "run": lambda: db.purge_rows(
+            db.cache_db_file, "level_1", "when_created", "-1 day"
+        ),
+    },
+    {
+        "name": "purge searches",
+        "minutes": 60,
+        "unit": "rows",
+        "run": lambda: db.purge_rows(
+            db.search_log_db_file, "searches", "date_time", "-90 days"
+        ),
+    },
+    {
+        "name": "purge search_tasks",
+        "minutes": 60,
+        "unit": "rows",
+        "run": lambda: db.purge_rows(
+            db.auto_search_db_file, "search_tasks", "when_created", "-30 days"
+        ),
+    },
+    {
+        "name": "vacuum and optimize",
+        "minutes": 60 * 24,
+        "unit": "pages",
+        "run": vacuum_and_optimize,
+    },
+]
+
+stats = {job["name"]: {"runs": 0, "purged": 0, "seconds": 0.0} for job in JOBS}
+
+
+def next_run(job: dict, first: bool = False) -> float:
+    # random offsets keep the jobs from lining up with each other
+    # (and with other hourly/daily tasks) run after run
+    interval = job["minutes"] * 60
+    if first:
+        return time.monotonic() + interval * random.uniform(0, JITTER)
+    return time.monotonic() + interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+async def run_job(job: dict) -> None:
+    started = time.monotonic()
+    try:
+        purged = await job["run"]()
+    except Exception as err:
+        print(f"*** ERROR: maintenance {job['name']} - {err}")
+        return None
+    elapsed = time.monotonic() - started
+    job_stats = stats[job["name"]]
+    job_stats["runs"] += 1
+    job_stats["purged"] += purged
+    job_stats["seconds"] += elapsed
+    if purged or elapsed > 1:
+        print(
+            f"maintenance: {job['name']} - {purged} {job['unit']} in {elapsed:.2f} s "
+            f"(total {job_stats['purged']} in {job_stats['seconds']:.1f} s)"
+        )
+
+
+async def run() -> None:
+    # one task runs all jobs one after another, so they never overlap
+    next_runs = [next_run(job, first=True) for job in JOBS]
+    while True:
+        i = min(range(len(JOBS)), key=next_runs.__getitem__)
+        await asyncio.sleep(max(0.0, next_runs[i] - time.monotonic()))
+        await run_job(JOBS[i])
+        next_runs[i] = next_run(JOBS[i])
@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class MemoryCache:
+    # LRU cache bounded by the total size of its entries in bytes;
+    # an entry also expires ttl seconds after it was created
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (value, size, expires)
+        self.entries: OrderedDict[Hashable, tuple[Any, int, float]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self.entries.get(key)
+        if entry is not None and entry[2] <= time.time():
+            self.pop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def contains(self, key: Hashable) -> bool:
+        # unlike get, leaves counters and LRU order alone
+        entry = self.entries.get(key)
+        return entry is not None and entry[2] > time.time()
+
+    def put(
+        self, key: Hashable, value: Any, size: int, created: float | None = None
+    ) -> None:
+        expires = (created or time.time()) + self.ttl
+        if size > self.max_bytes or expires <= time.time():
+            return None
+        self.pop(key)
+        self.entries[key] = (value, size, expires)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def invalidate(self, match: Callable[[Hashable], bool]) -> int:
+        keys = [key for key in self.entries if match(key)]
+        for key in keys:
+            self.pop(key)
+        return len(keys)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,52 @@
+from lxml import etree, html
+
+CAPTCHA_IMG_PREFIX = "data:image/png;base64,"
+
+xml_parser = etree.XMLParser(resolve_entities=False, no_network=True)
+
+
+def parse_form_page(page: str | bytes) -> tuple[str | None, str | None]:
+    # returns captcha image (base64 PNG) and JSF view state of create.xhtml;
+    # parsed as bytes: lxml rejects a str with an XML encoding declaration
+    if isinstance(page, str):
+        page = page.encode()
+    try:
+        tree = html.fromstring(page)
+    except (etree.ParserError, ValueError):
+        return None, None
+    img_src = tree.xpath('//span[@id="captchaImage"]//img/@src')
+    viewstate = tree.xpath('//input[@id="j_id1:javax.faces.ViewState:0"]/@value')
+    if not img_src or not viewstate:
+        return None, None
+    return str(img_src[0]).removeprefix(CAPTCHA_IMG_PREFIX), str(viewstate[0])
+
+
+def parse_check_response(xml: str) -> dict:
+    # partial/ajax answer to the "check person" button; raises ValueError
+    # if the answer has no rendered form (e.g. an expired view state)
+    try:
+        root = etree.fromstring(xml.encode(), xml_parser)
+    except etree.XMLSyntaxError as err:
+        raise ValueError(f"NCA response is not XML: {err}") from err
+    form_html = root.xpath('string(//update[@id="indexForm"])')
+    if not form_html:
+        raise ValueError("NCA response has no indexForm update")
+    form = html.fragment_fromstring(form_html, create_parent="div")
+    alert = form.xpath('.//li[@role="alert"]')
+    if alert:
+        return {"alert": alert[0].text_content()}
+    return {
+        "alert": None,
+        "last_name": span_text(form, "lastname"),
+        "first_name": span_text(form, "firstname"),
+        "middle_name": span_text(form, "middlename"),
+    }
+
+
+def span_text(form: html.HtmlElement, class_name: str) -> str | None:
+    spans = form.xpath(
+        f'.//span[contains(concat(" ", normalize-space(@class), " "), " {class_name} ")]'
+    )
+    if not spans or len(spans[0]) or not spans[0].text:
+        return None
+    return str(spans[0].text)
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+import aiohttp
+
+from app import upstream
+
+FetchToken = Callable[[aiohttp.ClientSession], Awaitable[tuple[str | None, str | None]]]
+
+
+class TokenPool:
+    # fetches and solves NCA captchas ahead of demand; a token is a solved
+    # captcha with its JSF view state and the client the view belongs to.
+    # Every worker owns its client (session with a separate cookie jar) and
+    # fetches the next view only after the previous token is released, so
+    # parallel view states never share a server-side session.
+    def __init__(
+        self,
+        fetch_token: FetchToken,
+        workers: int,
+        token_ttl: float,
+        idle_seconds: float,
+        views_per_session: int = 10,
+    ) -> None:
+        self.fetch_token = fetch_token
+        self.workers = workers  # = clients = tokens ready at most
+        self.token_ttl = token_ttl
+        self.idle_seconds = idle_seconds
+        self.views_per_session = views_per_session
+        self.queue: asyncio.Queue | None = None
+        self.tasks: list[asyncio.Task] = []
+        self.clients: list[dict] = []
+        self.last_demand = 0.0
+        self.expired = 0
+        self.recycled = 0
+
+    async def get(self) -> dict:
+        self.last_demand = time.monotonic()
+        self.ensure_running()
+        while True:
+            token = await self.queue.get()
+            if time.monotonic() - token["created"] < self.token_ttl:
+                return token
+            self.expired += 1
+            self.release(token, ok=True)
+
+    def release(self, token: dict, ok: bool | None) -> None:
+        # ok None - the check was cancelled and says nothing about the client
+        client = token["client"]
+        client["outstanding"] -= 1
+        if ok is False:
+            client["bad"] = True
+        client["released"].set()
+        self.close_if_unused(client)
+
+    def ensure_running(self) -> None:
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        self.tasks = [task for task in self.tasks if not task.done()]
+        while len(self.tasks) < self.workers:
+            self.tasks.append(asyncio.create_task(self.worker()))
+
+    def new_client(self) -> dict:
+        client = {
+            "session": upstream.nca_session(),
+            "issued": 0,
+            "outstanding": 0,
+            "bad": False,
+            "retired": False,
+            "released": asyncio.Event(),
+        }
+        self.clients.append(client)
+        return client
+
+    def retire_client(self, client: dict) -> None:
+        if client["retired"]:
+            return None
+        client["retired"] = True
+        if client["bad"]:
+            self.recycled += 1
+        self.close_if_unused(client)
+
+    def close_if_unused(self, client: dict) -> None:
+        # a retired session is closed only after its last token is used
+        if client["retired"] and client["outstanding"] <= 0 and client in self.clients:
+            self.clients.remove(client)
+            asyncio.create_task(client["session"].close())
+
+    async def worker(self) -> None:
+        client = self.new_client()
+        errors = 0
+        try:
+            while time.monotonic() - self.last_demand < self.idle_seconds:
+                if (
+                    client["bad"]
+                    or client["retired"]
+                    or client["issued"] >= self.views_per_session
+                ):
+                    self.retire_client(client)
+                    client = self.new_client()
+                try:
+                    captcha_answer, viewstate = await self.fetch_token(
+                        client["session"]
+                    )
+                except Exception as err:
+                    print(f"*** ERROR: TokenPool.worker - {err!r}")
+                    captcha_answer = viewstate = None
+                if not captcha_answer:
+                    errors += 1
+                    client["bad"] = True
+                    await asyncio.sleep(min(30, 2**errors))
+                    continue
+                errors = 0
+                client["issued"] += 1
+                client["outstanding"] += 1
+                token = {
+                    "client": client,
+                    "session": client["session"],
+                    "captcha": captcha_answer,
+                    "viewstate": viewstate,
+                    "created": time.monotonic(),
+                }
+                client["released"].clear()
+                await self.queue.put(token)
+                try:
+                    # one outstanding token per client: a new view on the same
+                    # session would clobber the view state of the queued one
+                    await asyncio.wait_for(client["released"].wait(), self.token_ttl)
+                except asyncio.TimeoutError:
+                    # the token expires unused in the queue, the next view
+                    # is fetched on a new client
+                    self.retire_client(client)
+        finally:
+            self.retire_client(client)
+
+    async def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        for client in self.clients:
+            await client["session"].close()
+        self.clients = []
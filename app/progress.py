@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from aiogram.types import Message
+
+from app import utils
+
+
+class SearchProgress:
+    # edits one status message while a search runs; edits are throttled to
+    # stay within Telegram limits, the latest state is always shown at the end
+    def __init__(self, message: Message, header: str, min_interval: float = 1.5):
+        self.message = message
+        self.header = header
+        self.min_interval = min_interval
+        self.counters = {
+            "postkz_checked": 0,
+            "postkz_total": 0,
+            "nca_checked": 0,
+            "nca_total": 0,
+        }
+        self.iins_found = []
+        self.last_text = ""
+        self.last_edit = 0.0
+        self.flush_task: asyncio.Task | None = None
+        self.done = False
+
+    def add(self, counter: str, value: int = 1) -> None:
+        self.counters[counter] += value
+        self.schedule()
+
+    def found(self, iin: dict) -> None:
+        self.iins_found.append(iin)
+        self.schedule()
+
+    def schedule(self) -> None:
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.delayed_flush())
+
+    async def delayed_flush(self) -> None:
+        delay = self.last_edit + self.min_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.flush()
+
+    async def flush(self) -> None:
+        text = self.render()
+        if text == self.last_text:
+            return None
+        self.last_text = text
+        self.last_edit = time.monotonic()
+        try:
+            await self.message.edit_text(text=text)
+        except Exception as err:
+            print(f"*** ERROR: SearchProgress.flush - {err}")
+
+    async def close(self) -> None:
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        self.done = True
+        await self.flush()
+
+    def render(self) -> str:
+        text = self.header
+        counters = self.counters
+        mark = "☑️" if self.done else "⏳"
+        if counters["postkz_total"]:
+            text += (
+                f"\n\n{mark} <b>post.kz:</b> проверено "
+                f"{counters['postkz_checked']}/{counters['postkz_total']} ИИН"
+            )
+        if counters["nca_total"]:
+            text += (
+                f"\n{mark} <b>НУЦ РК:</b> проверено "
+                f"{counters['nca_checked']}/{counters['nca_total']} ИИН"
+            )
+        if self.iins_found:
+            text += "\n\n✅ <b>Уже найдено:</b>\n"
+            for iin in self.iins_found:
+                text += f"<code>{iin['iin']}</code> {utils.get_full_name(iin)}\n"
+        return text
@@ -0,0 +1,53 @@
+import asyncio
+import random
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class UpstreamError(Exception):
+    # upstream answered, but with a status worth retrying (5xx, 429)
+    pass
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 10.0) -> float:
+    # exponential backoff with full jitter
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+async def hedged(
+    make_call: Callable[[], Awaitable[T]],
+    hedge_delay: float,
+    sent: asyncio.Event | None = None,
+) -> T:
+    # starts a duplicate call if the first one is slower than hedge_delay and
+    # returns the first successful result (or the last error if both fail);
+    # with sent, the delay counts from sent.set() (e.g. once a limiter slot is
+    # taken), so calls that only wait in a queue are never duplicated
+    first = asyncio.ensure_future(make_call())
+    pending = {first}
+    sending = None
+    error = None
+    try:
+        if sent is not None:
+            sending = asyncio.ensure_future(sent.wait())
+            await asyncio.wait({first, sending}, return_when=asyncio.FIRST_COMPLETED)
+        done, _ = await asyncio.wait({first}, timeout=hedge_delay)
+        if done:
+            return first.result()
+        pending.add(asyncio.ensure_future(make_call()))
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for call in done:
+                if call.exception() is None:
+                    return call.result()
+                error = call.exception()
+        raise error
+    finally:
+        # also runs for a cancelled caller: no call is left behind
+        if sending is not None:
+            sending.cancel()
+        for call in pending:
+            call.cancel()
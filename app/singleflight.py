@@ -0,0 +1,74 @@
+import asyncio
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Hashable
+
+if TYPE_CHECKING:
+    from app.progress import SearchProgress
+
+
+class CallProgress:
+    # progress of a shared call, forwarded to the progress of every caller;
+    # a caller joining late first catches up on what was reported so far
+    def __init__(self) -> None:
+        self.targets: list["SearchProgress"] = []
+        self.counters = Counter()
+        self.iins_found = []
+
+    def join(self, target: "SearchProgress") -> None:
+        for counter, value in self.counters.items():
+            target.add(counter, value)
+        for iin in self.iins_found:
+            target.found(iin)
+        self.targets.append(target)
+
+    def leave(self, target: "SearchProgress") -> None:
+        if target in self.targets:
+            self.targets.remove(target)
+
+    def add(self, counter: str, value: int = 1) -> None:
+        self.counters[counter] += value
+        for target in self.targets:
+            target.add(counter, value)
+
+    def found(self, iin: dict) -> None:
+        self.iins_found.append(iin)
+        for target in self.targets:
+            target.found(iin)
+
+
+class SingleFlight:
+    # concurrent calls with the same key share one execution: the first
+    # caller (leader) starts it, the followers await the leader's result
+    def __init__(self) -> None:
+        self.calls: dict[Hashable, asyncio.Future] = {}
+        self.progress: dict[Hashable, CallProgress] = {}
+        self.coalesced = 0
+
+    async def run(
+        self,
+        key: Hashable,
+        make_call: Callable[[CallProgress], Awaitable[Any]],
+        progress: "SearchProgress | None" = None,
+    ) -> Any:
+        # make_call reports to a CallProgress, so followers see progress too
+        call = self.calls.get(key)
+        if call is None:
+            self.progress[key] = CallProgress()
+            call = asyncio.ensure_future(make_call(self.progress[key]))
+            self.calls[key] = call
+            call.add_done_callback(lambda _: self.forget(key))
+        else:
+            self.coalesced += 1
+        call_progress = self.progress[key]
+        if progress:
+            call_progress.join(progress)
+        try:
+            # a cancelled caller must not cancel the call other callers wait for
+            return await asyncio.shield(call)
+        finally:
+            if progress:
+                call_progress.leave(progress)
+
+    def forget(self, key: Hashable) -> None:
+        self.calls.pop(key, None)
+        self.progress.pop(key, None)
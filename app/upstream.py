@@ -0,0 +1,45 @@
+import aiohttp
+
+CONNECTIONS_LIMIT = 400
+CONNECTIONS_PER_HOST = 200
+DNS_CACHE_SECONDS = 300
+KEEPALIVE_SECONDS = 30
+TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10, sock_read=20)
+
+connector: aiohttp.TCPConnector | None = None
+shared_session: aiohttp.ClientSession | None = None
+
+
+def start() -> aiohttp.ClientSession:
+    global connector, shared_session
+    if shared_session is None or shared_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=CONNECTIONS_LIMIT,
+            limit_per_host=CONNECTIONS_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_SECONDS,
+            keepalive_timeout=KEEPALIVE_SECONDS,
+        )
+        shared_session = aiohttp.ClientSession(connector=connector, timeout=TIMEOUT)
+    return shared_session
+
+
+async def close() -> None:
+    global connector, shared_session
+    if shared_session is not None:
+        await shared_session.close()
+    shared_session = connector = None
+
+
+def session() -> aiohttp.ClientSession:
+    # application-wide session for stateless calls (post.kz)
+    return start()
+
+
+def nca_session() -> aiohttp.ClientSession:
+    # NCA keeps JSF view state in a server-side session bound to cookies, so
+    # each token pool client gets its own cookie jar on top of the shared
+    # connection pool
+    start()
+    return aiohttp.ClientSession(
+        connector=connector, connector_owner=False, timeout=TIMEOUT
+    )
@@ -1,50 +1,198 @@
 import asyncio
+from bisect import bisect_left
+from collections import Counter
 from datetime import date, datetime, timedelta, timezone
+from os import getenv
+from typing import TYPE_CHECKING, Callable
 
 import aiohttp
-from bs4 import BeautifulSoup
+import numpy as np
 
-from app import constants, captcha, databases as db
+from app import constants, captcha, nca_parser, retry, upstream, databases as db
+from app.limiter import AdaptiveLimiter
+from app.nca_pool import TokenPool
+from app.singleflight import CallProgress, SingleFlight
+
+if TYPE_CHECKING:
+    from app.progress import SearchProgress
+
+OnChecked = Callable[[dict], None] | None
+
+CAPTCHA_ATTEMPTS = 3  # captcha re-fetches while the solver is not confident
+NCA_ATTEMPTS = 3  # form posts per IIN while NCA rejects the captcha
+CAPTCHA_ALERT_MARKERS = ("код с картинки", "капч", "captcha")
+
+NCA_TOKEN_WAIT = 60  # seconds a check waits for a solved captcha
+POSTKZ_ATTEMPTS = 3
+POSTKZ_HEDGE_DELAY = 3.0  # seconds before a duplicate post.kz request is sent
+NCA_HEDGE_DELAY = 10.0  # seconds before a duplicate NCA check is started
+POSTKZ_SCAN = getenv("POSTKZ_SCAN", "adaptive")  # "adaptive" or "fixed"
+SCAN_CHUNK = 50  # candidates per post.kz round in adaptive scan
+SCAN_EMPTY_WINDOW = 40  # empty answers after the last name that end the scan
+SCAN_MAX_UNKNOWN = 0.5  # share of "unknown" answers in a chunk that ends the scan
+FRONTIER_VERIFY = 3  # consecutive candidates checked by every frontier probe
+FRONTIER_STEP = 8  # first galloping step of the frontier search
+# "off" / "on_empty" (after a standard search found nothing) / "parallel"
+SPECULATIVE_DEEP_SEARCH = getenv("SPECULATIVE_DEEP_SEARCH", "off")
+PREFETCH_CONCURRENCY = 2  # post.kz prefetches running at the same time
+
+postkz_limiter = AdaptiveLimiter(
+    initial_limit=50, min_limit=5, max_limit=300, latency_target=2.0
+)
+postkz_flights = SingleFlight()  # key: (birth_date, digit_8th)
+nca_flights = SingleFlight()  # key: (birth_date, name, digit_8th)
+prefetch_slots = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+background_tasks = set()
+prefetch_priorities = {}  # (birth_date, digit_8th) -> priority of a running prefetch
+upstream_calls = Counter()  # requests sent: "postkz", "nca_form", "nca_check"
+
+
+CHECK_WEIGHTS = (
+    (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11),
+    (3, 4, 5, 6, 7, 8, 9, 10, 11, 1, 2),
+)
+MAX_SUFFIX = 999
+
+
+def build_suffix_table() -> dict[tuple[int, int], tuple[list[int], list[str]]]:
+    # check digit depends on the date prefix only through its two weighted sums
+    # (mod 11), so valid suffixes can be precomputed for all 121 prefix classes
+    suffixes = np.arange(1, MAX_SUFFIX + 1)
+    suffix_digits = np.stack([suffixes // 100, suffixes // 10 % 10, suffixes % 10], 1)
+    suffix_sums = suffix_digits @ np.array(CHECK_WEIGHTS)[:, 8:].T
+    suffix_strs = [f"{suffix:03}" for suffix in suffixes.tolist()]
+    suffix_table = {}
+    for prefix_sum_1 in range(11):
+        for prefix_sum_2 in range(11):
+            check_digits = (suffix_sums + (prefix_sum_1, prefix_sum_2)) % 11
+            check_digits = np.where(
+                check_digits[:, 0] == 10, check_digits[:, 1], check_digits[:, 0]
+            )
+            valid = np.flatnonzero(check_digits < 10).tolist()
+            check_digits = check_digits.tolist()
+            suffix_table[prefix_sum_1, prefix_sum_2] = (
+                [i + 1 for i in valid],
+                [f"{suffix_strs[i]}{check_digits[i]}" for i in valid],
+            )
+    return suffix_table
+
+
+suffix_table = build_suffix_table()
+
+
+def iin_prefixes(
+    birth_dates: list[date], digit_8th: int
+) -> tuple[list[str], np.ndarray]:
+    prefixes = [f"{birth_date:%y%m%d}0{digit_8th}" for birth_date in birth_dates]
+    prefix_digits = np.frombuffer("".join(prefixes).encode(), dtype=np.uint8) - 48
+    prefix_digits = prefix_digits.reshape(len(prefixes), 8).astype(np.int32)
+    prefix_sums = prefix_digits @ np.array(CHECK_WEIGHTS, dtype=np.int32)[:, :8].T % 11
+    return prefixes, prefix_sums
+
+
+def generate_iins_batch(
+    birth_dates: list[date], digit_8th: int = 5, quantity: int = 300
+) -> dict[date, list[str]]:
+    if not birth_dates:
+        return {}
+    prefixes, prefix_sums = iin_prefixes(birth_dates, digit_8th)
+    iins_by_date = {}
+    for birth_date, prefix, (sum_1, sum_2) in zip(
+        birth_dates, prefixes, prefix_sums.tolist()
+    ):
+        suffixes, tails = suffix_table[sum_1, sum_2]
+        tails = tails[: bisect_left(suffixes, quantity)]
+        iins_by_date[birth_date] = [prefix + tail for tail in tails]
+    return iins_by_date
+
+
+def generate_iins_range(
+    first_date: date, last_date: date, digit_8th: int = 5, quantity: int = 300
+) -> dict[date, list[str]]:
+    days = (last_date - first_date).days + 1
+    birth_dates = [first_date + timedelta(days=n) for n in range(days)]
+    return generate_iins_batch(birth_dates, digit_8th=digit_8th, quantity=quantity)
 
 
 def generate_iins(
     birth_date: date, digit_8th: int = 5, quantity: int = 300
 ) -> list[str]:
-    iins_possible = []
-    for suffix in range(1, quantity):
-        iin_11 = f"{birth_date:%y%m%d}0{digit_8th}{str(suffix).zfill(3)}"
-        if checksum(iin_11) < 10:
-            iins_possible.append(f"{iin_11}{checksum(iin_11)}")
-    return iins_possible
+    return generate_iins_batch([birth_date], digit_8th, quantity)[birth_date]
 
 
 def checksum(iin_11: str) -> int:
-    check_nums = (
-        (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11),
-        (3, 4, 5, 6, 7, 8, 9, 10, 11, 1, 2),
-    )
-    check_digit = sum([int(x) * y for (x, y) in zip(iin_11, check_nums[0])]) % 11
+    check_digit = sum([int(x) * y for (x, y) in zip(iin_11, CHECK_WEIGHTS[0])]) % 11
     if check_digit == 10:
-        check_digit = sum([int(x) * y for (x, y) in zip(iin_11, check_nums[1])]) % 11
+        check_digit = sum([int(x) * y for (x, y) in zip(iin_11, CHECK_WEIGHTS[1])]) % 11
     return check_digit
 
 
 async def mass_upd_iins_postkz(
-    session: aiohttp.ClientSession, iins: list[str]
+    session: aiohttp.ClientSession,
+    iins: list[str],
+    on_checked: OnChecked = None,
+    priority: dict | None = None,
 ) -> list[dict]:
-    tasks = []
+    # only IINs without a stored name are sent to post.kz
+    postkz_names = await db.read_postkz_names(iins)
+    tasks = {}
+    for iin in iins:
+        if iin not in postkz_names:
+            tasks[iin] = asyncio.create_task(
+                update_iin_postkz(session, iin, priority)
+            )
+            if on_checked:
+                tasks[iin].add_done_callback(lambda task: on_checked(task.result()))
+        elif on_checked:
+            on_checked({"iin": iin, **postkz_names[iin]})
+    await asyncio.gather(*tasks.values())
+    iins_updated = [task.result() for task in tasks.values()]
+    await db.write_postkz_names(iins_updated)
+    iins_postkz = []
     for iin in iins:
-        task = asyncio.create_task(update_iin_postkz(session, iin))
-        tasks.append(task)
-    return await asyncio.gather(*tasks)
+        if iin in tasks:
+            iins_postkz.append(tasks[iin].result())
+        else:
+            iins_postkz.append(
+                {"iin": iin, **postkz_names[iin], "postkz_status": "found"}
+            )
+    return iins_postkz
 
 
-async def update_iin_postkz(session: aiohttp.ClientSession, iin: str) -> dict:
+async def update_iin_postkz(
+    session: aiohttp.ClientSession, iin: str, priority: dict | None = None
+) -> dict:
+    # postkz_status "unknown" - no answer after all retries (not the same as empty)
     iin_data = {
         "iin": iin,
         "name": None,
         "kgd_date": None,
+        "postkz_status": "unknown",
     }
+    for attempt in range(POSTKZ_ATTEMPTS):
+        sent = asyncio.Event()
+        try:
+            iin_data.update(
+                await retry.hedged(
+                    lambda: request_postkz(session, iin, sent, priority),
+                    POSTKZ_HEDGE_DELAY,
+                    sent,
+                )
+            )
+            break
+        except (aiohttp.ClientError, asyncio.TimeoutError, retry.UpstreamError) as err:
+            print(f"*** ERROR: update_iin_postkz - {err!r}")
+            if attempt < POSTKZ_ATTEMPTS - 1:
+                await asyncio.sleep(retry.backoff_delay(attempt))
+    return iin_data
+
+
+async def request_postkz(
+    session: aiohttp.ClientSession,
+    iin: str,
+    sent: asyncio.Event | None = None,
+    priority: dict | None = None,
+) -> dict:
     headers = {
         "Content-Type": "application/json;charset=UTF-8",
         "User-Agent": constants.USER_AGENT,
@@ -52,17 +200,149 @@ async def update_iin_postkz(session: aiohttp.ClientSession, iin: str) -> dict:
         "Referer": constants.POSTKZ_URL,
     }
     json = {"iinBin": iin}
+    started = await postkz_limiter.acquire(priority)
+    if sent is not None:
+        sent.set()
+    answered = None  # stays None if cancelled (a hedge loser): no limiter signal
+    upstream_calls["postkz"] += 1
     try:
         async with session.post(
             url=constants.POSTKZ_API_URL, headers=headers, json=json
         ) as response:
+            # 4xx (except 429) is a normal answer for an IIN missing in KGD base
+            answered = response.status < 500 and response.status != 429
+            if not answered:
+                raise retry.UpstreamError(f"post.kz status {response.status}")
             if response.status == 202:
                 response_json = await response.json()
-                iin_data["name"] = response_json["fio"]
-                iin_data["kgd_date"] = response_json["correctDt"].split()[0]
-    except aiohttp.ClientConnectionError as err:
-        print(f"*** ERROR: update_iin_postkz - {err}")
-    return iin_data
+                return {
+                    "name": response_json["fio"],
+                    "kgd_date": response_json["correctDt"].split()[0],
+                    "postkz_status": "found",
+                }
+            return {"postkz_status": "not_found"}
+    except Exception:
+        answered = False
+        raise
+    finally:
+        await postkz_limiter.release(started, success=answered)
+
+
+async def scan_postkz(
+    session: aiohttp.ClientSession,
+    birth_date: date,
+    digit_8th: int,
+    progress: CallProgress | None = None,
+    priority: dict | None = None,
+) -> list[dict]:
+    on_checked = None
+    if progress:
+
+        def on_checked(_: dict) -> None:
+            progress.add("postkz_checked")
+
+    if POSTKZ_SCAN == "fixed":
+        iins_possible = generate_iins(birth_date, digit_8th=digit_8th, quantity=300)
+        if progress:
+            progress.add("postkz_total", len(iins_possible))
+        return await mass_upd_iins_postkz(
+            session, iins_possible, on_checked, priority
+        )
+    # adaptive: query in chunks until the issuance frontier is clearly passed;
+    # a known frontier sizes the first chunk so most dates need a single round
+    iins_possible = generate_iins(
+        birth_date, digit_8th=digit_8th, quantity=MAX_SUFFIX + 1
+    )
+    frontier = await db.read_frontier(birth_date, digit_8th)
+    first_chunk = SCAN_CHUNK
+    if frontier is not None:
+        first_chunk = max(
+            SCAN_CHUNK, suffix_index(iins_possible, frontier) + SCAN_EMPTY_WINDOW
+        )
+    iins_postkz = []
+    chunk_start, chunk_end = 0, first_chunk
+    while chunk_start < len(iins_possible):
+        chunk = iins_possible[chunk_start:chunk_end]
+        if progress:
+            progress.add("postkz_total", len(chunk))
+        iins_chunk = await mass_upd_iins_postkz(session, chunk, on_checked, priority)
+        iins_postkz += iins_chunk
+        if trailing_empty_count(iins_postkz) >= SCAN_EMPTY_WINDOW:
+            break
+        # post.kz is down: more chunks would only add load, the result is not
+        # cached anyway and the next search scans again
+        unknown = sum(iin["postkz_status"] == "unknown" for iin in iins_chunk)
+        if unknown > len(iins_chunk) * SCAN_MAX_UNKNOWN:
+            print(f"*** ERROR: scan_postkz - {unknown} unknown answers, scan stopped")
+            break
+        chunk_start, chunk_end = chunk_end, chunk_end + SCAN_CHUNK
+    last_suffix = last_named_suffix(iins_postkz)
+    if last_suffix is not None:
+        await db.write_frontier(birth_date, digit_8th, last_suffix)
+    return iins_postkz
+
+
+async def locate_frontier(
+    session: aiohttp.ClientSession, birth_date: date, digit_8th: int
+) -> int | None:
+    # galloping + binary search for the last IIN with a name in KGD base;
+    # every probe checks a window of FRONTIER_VERIFY candidates to skip gaps
+    iins_possible = generate_iins(
+        birth_date, digit_8th=digit_8th, quantity=MAX_SUFFIX + 1
+    )
+    probes = {}
+
+    async def issued(index: int) -> bool:
+        if index not in probes:
+            window = iins_possible[index : index + FRONTIER_VERIFY]
+            probes[index] = await mass_upd_iins_postkz(session, window)
+        return last_named_suffix(probes[index]) is not None
+
+    frontier = await db.read_frontier(birth_date, digit_8th)
+    lo = suffix_index(iins_possible, frontier) if frontier is not None else 0
+    if not await issued(lo):
+        lo, hi = -1, lo
+    else:
+        step = FRONTIER_STEP
+        hi = min(lo + step, len(iins_possible) - 1)
+        while hi > lo and await issued(hi):
+            lo, step = hi, step * 2
+            hi = min(lo + step, len(iins_possible) - 1)
+        if hi == lo:
+            hi = len(iins_possible)
+    while hi - lo > FRONTIER_VERIFY:
+        mid = (lo + hi) // 2
+        if await issued(mid):
+            lo = mid
+        else:
+            hi = mid
+    if lo < 0 and not await issued(0):
+        return None
+    last_suffix = last_named_suffix(probes[max(lo, 0)])
+    await db.write_frontier(birth_date, digit_8th, last_suffix)
+    return last_suffix
+
+
+def suffix_index(iins_possible: list[str], suffix: int) -> int:
+    return bisect_left([int(iin[8:11]) for iin in iins_possible], suffix)
+
+
+def last_named_suffix(iins_postkz: list[dict]) -> int | None:
+    for iin in reversed(iins_postkz):
+        if iin["name"]:
+            return int(iin["iin"][8:11])
+    return None
+
+
+def trailing_empty_count(iins_postkz: list[dict]) -> int:
+    # confirmed empty answers after the last named IIN ("unknown" not counted)
+    empty_count = 0
+    for iin in reversed(iins_postkz):
+        if iin["name"]:
+            break
+        if iin.get("postkz_status") == "not_found":
+            empty_count += 1
+    return empty_count
 
 
 def match_name_postkz(input_name: str, iins_postkz: list[dict]) -> list[dict]:
@@ -92,37 +372,115 @@ def empty_name_postkz(iins_postkz: list[dict]) -> list[dict]:
 
 
 async def mass_upd_iins_nca(
-    session: aiohttp.ClientSession, iins: list[dict]
+    iins: list[dict], on_checked: OnChecked = None
 ) -> list[dict]:
+    # IINs with a known owner are taken from the registry, not from NCA
+    nca_owners = await db.read_nca_owners([iin["iin"] for iin in iins])
     tasks = []
     for iin in iins:
-        img_data, viewstate = await get_captcha(session, constants.NCA_URL)
-        if img_data:
-            captcha_answer = captcha.resolve_captcha(img_data)
-            task = asyncio.create_task(
-                update_iin_nca(session, iin, captcha_answer, viewstate)
-            )
+        if iin["iin"] in nca_owners:
+            iin.update(nca_owners[iin["iin"]], nca_status="found")
+            if on_checked:
+                on_checked(iin)
+        else:
+            task = asyncio.create_task(check_iin_nca(iin))
+            if on_checked:
+                task.add_done_callback(lambda task: on_checked(task.result()))
             tasks.append(task)
-    return await asyncio.gather(*tasks)
+    await db.write_nca_owners(await asyncio.gather(*tasks))
+    return iins
+
+
+async def check_iin_nca(iin: dict) -> dict:
+    for attempt in range(NCA_ATTEMPTS):
+        sent = asyncio.Event()
+        try:
+            iin.update(
+                await retry.hedged(
+                    lambda: nca_attempt(iin, sent), NCA_HEDGE_DELAY, sent
+                )
+            )
+        except asyncio.TimeoutError:
+            print(f"*** ERROR: check_iin_nca - no captcha token for {iin['iin']}")
+            set_nca_status(iin, "error")
+            break
+        except retry.UpstreamError as err:
+            print(f"*** ERROR: check_iin_nca - {err}")
+            set_nca_status(iin, "error")
+            if attempt < NCA_ATTEMPTS - 1:
+                await asyncio.sleep(retry.backoff_delay(attempt))
+            continue
+        if iin["nca_status"] != "captcha_rejected":
+            break
+    return iin
+
+
+async def nca_attempt(iin: dict, sent: asyncio.Event | None = None) -> dict:
+    # works on a copy, so a hedged duplicate never mixes results with the original
+    token = await asyncio.wait_for(nca_tokens.get(), NCA_TOKEN_WAIT)
+    if sent is not None:
+        sent.set()
+    ok = None  # stays None if cancelled (hedge loser): the client is not bad
+    try:
+        iin_data = await update_iin_nca(
+            token["session"], dict(iin), token["captcha"], token["viewstate"]
+        )
+        ok = iin_data["nca_status"] != "error"
+    except Exception:
+        ok = False
+        raise
+    finally:
+        # a cancelled check (hedge loser, cancelled search) still returns its
+        # token, otherwise the client's session is never closed
+        nca_tokens.release(token, ok=ok)
+    if not ok:
+        raise retry.UpstreamError(f"NCA check failed for {iin['iin']}")
+    return iin_data
+
 
+async def get_solved_captcha(
+    session: aiohttp.ClientSession,
+) -> tuple[str | None, str | None]:
+    for _ in range(CAPTCHA_ATTEMPTS):
+        img_data, viewstate = await get_captcha(session, constants.NCA_API_URL)
+        if not img_data:
+            return None, None
+        captcha_answer = await captcha.solve(img_data)
+        if captcha_answer:
+            return captcha_answer, viewstate
+    return None, None
 
-async def get_captcha(session: aiohttp.ClientSession, url: str) -> tuple[str, str]:
+
+nca_tokens = TokenPool(
+    fetch_token=get_solved_captcha, workers=8, token_ttl=120, idle_seconds=60
+)
+
+
+def set_nca_status(iin: dict, status: str) -> None:
+    # "found" / "not_found" - NCA answered; "captcha_rejected" / "error" - unknown
+    iin["nca_status"] = status
+    if status != "found":
+        iin["last_name"] = iin["first_name"] = iin["middle_name"] = None
+
+
+async def get_captcha(
+    session: aiohttp.ClientSession, url: str
+) -> tuple[str | None, str | None]:
     headers = {
         "User-Agent": constants.USER_AGENT,
     }
+    upstream_calls["nca_form"] += 1
     try:
         async with session.get(url=url, headers=headers) as response:
-            page = await response.text()
-    except aiohttp.ClientConnectionError as err:
-        print(f"*** ERROR: get_captcha - {err}")
+            page = await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+        print(f"*** ERROR: get_captcha - {err!r}")
         return None, None
-    else:
-        soup = BeautifulSoup(markup=page, features="html.parser")
-        img_src = soup.find(name="span", id="captchaImage").find("img")["src"]
-        img_data = img_src.removeprefix("data:image/png;base64,")
-        viewstate = soup.find(name="input", id="j_id1:javax.faces.ViewState:0")["value"]
-        return img_data, viewstate
-    
+    img_data, viewstate = nca_parser.parse_form_page(page)
+    if not img_data:
+        print("*** ERROR: get_captcha - captcha or view state not found")
+    return img_data, viewstate
+
 
 async def update_iin_nca(
     session: aiohttp.ClientSession, iin: dict, captcha_answer: str, viewstate: str
@@ -149,28 +507,40 @@ async def update_iin_nca(
         "keyidStr": "",
         "javax.faces.ViewState": viewstate,
     }
+    upstream_calls["nca_check"] += 1
     try:
         async with session.post(
-            url=constants.NCA_URL, headers=headers, data=data
+            url=constants.NCA_API_URL, headers=headers, data=data
         ) as response:
             xml = await response.text()
-    except aiohttp.ClientConnectionError as err:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+        print(f"*** ERROR: update_iin_nca - {err!r}")
+        set_nca_status(iin, "error")
+        return iin
+    try:
+        answer = nca_parser.parse_check_response(xml)
+    except ValueError as err:
         print(f"*** ERROR: update_iin_nca - {err}")
-        iin["last_name"] = iin["first_name"] = iin["middle_name"] = None
+        set_nca_status(iin, "error")
     else:
-        xml_soup = BeautifulSoup(xml, "xml")
-        html = xml_soup.find("update", id="indexForm").string
-        html_soup = BeautifulSoup(html, "html.parser")
-        alert = html_soup.find("li", role="alert")
-        if alert:
-            iin["last_name"] = iin["first_name"] = iin["middle_name"] = None
+        if answer["alert"] is not None:
+            if is_captcha_alert(answer["alert"]):
+                set_nca_status(iin, "captcha_rejected")
+            else:
+                set_nca_status(iin, "not_found")
         else:
-            iin["last_name"] = html_soup.find("span", class_="lastname").string
-            iin["first_name"] = html_soup.find("span", class_="firstname").string
-            iin["middle_name"] = html_soup.find("span", class_="middlename").string
+            set_nca_status(iin, "found")
+            iin["last_name"] = answer["last_name"]
+            iin["first_name"] = answer["first_name"]
+            iin["middle_name"] = answer["middle_name"]
     return iin
 
 
+def is_captcha_alert(alert_text: str) -> bool:
+    alert_text = alert_text.casefold()
+    return any(marker in alert_text for marker in CAPTCHA_ALERT_MARKERS)
+
+
 def match_name_nca(input_name: str, nca_updated_iins: list[dict]) -> list[dict]:
     iins_matched_nca = []
     for iin in nca_updated_iins:
@@ -197,48 +567,192 @@ def get_full_name(iin_data: dict) -> str:
 
 
 async def find_iin(
-    birth_date: date, name: str, digit_8th: int = 5
+    birth_date: date,
+    name: str,
+    digit_8th: int = 5,
+    progress: "SearchProgress | None" = None,
 ) -> tuple[int, list[dict], list[dict]]:
     cache_used, cached_data = await db.read_cache(birth_date, name, digit_8th)
-    async with aiohttp.ClientSession() as session:
-        if cache_used == 2:
-            return cache_used, cached_data[0], cached_data[1]
-        elif cache_used == 1:
-            iins_postkz = cached_data
-        elif cache_used == 0:
-            iins_possible = generate_iins(birth_date, digit_8th=digit_8th, quantity=300)
-            iins_postkz = await mass_upd_iins_postkz(session, iins_possible)
-            data_to_cache = {
-                "search_date": birth_date,
-                "digit_8th": digit_8th,
-                "iins_postkz": iins_postkz,
-            }
-            await db.write_cache(cache_level=1, cache_data=data_to_cache)
-        iins_matched_postkz = match_name_postkz(name, iins_postkz)
-        iins_empty_postkz = empty_name_postkz(iins_postkz)
-        iins_possible_postkz = iins_matched_postkz + iins_empty_postkz
-        iins_nca = await mass_upd_iins_nca(session, iins_possible_postkz)
-        iins_found = match_name_nca(name, iins_nca)
-        iins_auto_search = [
-            {"iin": iin["iin"]}
-            for iin in iins_empty_postkz
-            if iin["iin"] not in [iin["iin"] for iin in iins_found]
-        ]
-        data_to_cache = {
-            "search_date": birth_date,
-            "search_name": name,
-            "digit_8th": digit_8th,
-            "iins_found": iins_found,
-            "iins_auto_search": iins_auto_search,
-        }
-        await db.write_cache(cache_level=2, cache_data=data_to_cache)
+    if cache_used == 2:
+        return cache_used, cached_data[0], cached_data[1]
+    elif cache_used == 1:
+        iins_postkz = cached_data
+    elif cache_used == 0:
+        prefetch_priority = prefetch_priorities.get((birth_date, digit_8th))
+        if prefetch_priority:
+            # a user now waits for the prefetch: it stops yielding to others
+            prefetch_priority["background"] = False
+        iins_postkz = await postkz_flights.run(
+            (birth_date, digit_8th),
+            lambda call_progress: postkz_stage(birth_date, digit_8th, call_progress),
+            progress,
+        )
+    iins_found, iins_auto_search = await nca_flights.run(
+        (birth_date, name, digit_8th),
+        lambda call_progress: nca_stage(
+            birth_date, name, digit_8th, iins_postkz, call_progress
+        ),
+        progress,
+    )
+    # results of a coalesced search are shared, every caller gets own copies
+    iins_found = [dict(iin) for iin in iins_found]
+    iins_auto_search = [dict(iin) for iin in iins_auto_search]
     return cache_used, iins_found, iins_auto_search
 
 
-async def find_iin_auto(iins_auto_search: list[dict], name: str) -> list[dict]:
-    async with aiohttp.ClientSession() as session:
-        iins_nca = await mass_upd_iins_nca(session, iins_auto_search)
-        return match_name_nca(name, iins_nca)
+async def postkz_stage(
+    birth_date: date,
+    digit_8th: int,
+    progress: CallProgress | None = None,
+    priority: dict | None = None,
+) -> list[dict]:
+    iins_postkz = await scan_postkz(
+        upstream.session(), birth_date, digit_8th, progress, priority
+    )
+    data_to_cache = {
+        "search_date": birth_date,
+        "digit_8th": digit_8th,
+        "iins_postkz": iins_postkz,
+    }
+    if all(iin["postkz_status"] != "unknown" for iin in iins_postkz):
+        await db.write_cache(cache_level=1, cache_data=data_to_cache)
+    return iins_postkz
+
+
+async def nca_stage(
+    birth_date: date,
+    name: str,
+    digit_8th: int,
+    iins_postkz: list[dict],
+    progress: CallProgress | None = None,
+) -> tuple[list[dict], list[dict]]:
+    iins_matched_postkz = [dict(iin) for iin in match_name_postkz(name, iins_postkz)]
+    iins_empty_postkz = empty_name_postkz(iins_postkz)
+    iins_possible_postkz = iins_matched_postkz + iins_empty_postkz
+    on_checked = None
+    if progress:
+        progress.add("nca_total", len(iins_possible_postkz))
+
+        def on_checked(iin: dict) -> None:
+            progress.add("nca_checked")
+            if match_name_nca(name, [iin]):
+                progress.found(iin)
+
+    iins_nca = await mass_upd_iins_nca(iins_possible_postkz, on_checked)
+    iins_found = match_name_nca(name, iins_nca)
+    nca_complete = all(iin["nca_status"] in ("found", "not_found") for iin in iins_nca)
+    iins_auto_search = [
+        {"iin": iin["iin"]}
+        for iin in iins_empty_postkz
+        if iin["nca_status"] != "found"
+    ]
+    data_to_cache = {
+        "search_date": birth_date,
+        "search_name": name,
+        "digit_8th": digit_8th,
+        "iins_found": iins_found,
+        "iins_auto_search": iins_auto_search,
+    }
+    if nca_complete:
+        await db.write_cache(cache_level=2, cache_data=data_to_cache)
+    return iins_found, iins_auto_search
+
+
+def prefetch_deep_search(birth_date: date, iins_found: list[dict] | None) -> None:
+    # iins_found is None while the standard search is still running
+    speculate = (SPECULATIVE_DEEP_SEARCH == "parallel" and iins_found is None) or (
+        SPECULATIVE_DEEP_SEARCH == "on_empty" and iins_found == []
+    )
+    if not speculate:
+        return None
+    task = asyncio.create_task(prefetch_postkz(birth_date, digit_8th=0))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def prefetch_postkz(birth_date: date, digit_8th: int) -> None:
+    # low priority: few prefetches at a time, skipped if already cached, and
+    # post.kz requests yield to searches; a real search started meanwhile joins
+    # the prefetch via postkz_flights and promotes it
+    async with prefetch_slots:
+        if await db.has_cache_level1(birth_date, digit_8th):
+            return None
+        key = (birth_date, digit_8th)
+        priority = {"background": True}
+        prefetch_priorities[key] = priority
+        try:
+            await postkz_flights.run(
+                key,
+                lambda call_progress: postkz_stage(
+                    birth_date, digit_8th, call_progress, priority
+                ),
+            )
+        finally:
+            if prefetch_priorities.get(key) is priority:
+                del prefetch_priorities[key]
+
+
+async def find_iin_auto(
+    iins_auto_search: list[dict],
+    name: str,
+    search_date: date,
+    last_suffix: int | None = None,
+) -> tuple[list[dict], list[dict], int]:
+    iins_new, last_suffix = await extend_auto_search(
+        iins_auto_search, name, search_date, last_suffix
+    )
+    iins_auto_search = iins_auto_search + iins_new
+    iins_nca = await mass_upd_iins_nca(iins_auto_search)
+    iins_found = match_name_nca(name, iins_nca)
+    # an IIN with a known owner is either found or belongs to someone else
+    iins_auto_search = [
+        {"iin": iin["iin"]} for iin in iins_nca if iin["nca_status"] != "found"
+    ]
+    return iins_found, iins_auto_search, last_suffix
+
+
+async def auto_search_start(
+    search_date: date, iins_auto_search: list[dict], digit_8th: int = 5
+) -> int:
+    # the last suffix a search has covered: its last candidate, or the range
+    # nca_stage checks past the last named IIN; -1 - nothing covered yet
+    if iins_auto_search:
+        return max(int(iin["iin"][8:11]) for iin in iins_auto_search)
+    frontier = await db.read_frontier(search_date, digit_8th)
+    return -1 if frontier is None else frontier + 4
+
+
+async def extend_auto_search(
+    iins_auto_search: list[dict],
+    name: str,
+    search_date: date,
+    last_suffix: int | None,
+    digit_8th: int = 5,
+) -> tuple[list[dict], int]:
+    # adds candidates issued after last_suffix (up to frontier + 4), also for
+    # tasks with no candidates left; returns them with the new last_suffix
+    if last_suffix is None:  # tasks created before last_suffix was stored
+        last_suffix = await auto_search_start(search_date, iins_auto_search, digit_8th)
+    session = upstream.session()
+    frontier = await locate_frontier(session, search_date, digit_8th)
+    if frontier is None:
+        return [], last_suffix
+    iins_new = [
+        iin
+        for iin in generate_iins(
+            search_date, digit_8th=digit_8th, quantity=min(MAX_SUFFIX, frontier + 4) + 1
+        )
+        if int(iin[8:11]) > last_suffix
+    ]
+    if not iins_new:
+        return [], last_suffix
+    iins_postkz = await mass_upd_iins_postkz(session, iins_new)
+    iins_new_candidates = [
+        {"iin": iin["iin"]}
+        for iin in iins_postkz
+        if not iin["name"] or iin["name"].casefold() == name
+    ]
+    return iins_new_candidates, int(iins_new[-1][8:11])
 
 
 def utc_to_msk(utc_datetime: str) -> str:
@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import base64
+import statistics
+import subprocess
+import time
+from pathlib import Path
+
+import ujson
+
+from app import captcha
+
+corpus_dir = Path("captcha_corpus")  # hand-verified live NCA captchas
+smoke_dir = Path("captcha_smoke")  # rendered from the templates: a smoke test only
+
+
+def load_corpus(corpus_path: Path) -> list[tuple[str, str, str]]:
+    # file name format: <answer>_<anything>.png (e.g. 48213_0001.png);
+    # files from --collect not yet checked by eye are skipped
+    samples = []
+    for file_path in sorted(corpus_path.glob("*.png")):
+        label = file_path.stem.split("_")[0]
+        if not label.isdigit() or "_unverified_" in file_path.name:
+            continue
+        img_data = base64.b64encode(file_path.read_bytes()).decode()
+        samples.append((file_path.name, label, img_data))
+    return samples
+
+
+def percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, round(pct / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def run_bench(samples: list[tuple[str, str, str]], rounds: int) -> dict:
+    captcha.resolve_captcha(samples[0][2])  # warm up
+    latencies = []
+    digits_total = digits_correct = captchas_correct = 0
+    per_digit = {str(digit): [0, 0] for digit in range(10)}  # [correct, total]
+    failures = []
+    started = time.perf_counter()
+    for round_num in range(rounds):
+        for file_name, label, img_data in samples:
+            t0 = time.perf_counter()
+            answer = captcha.resolve_captcha(img_data)
+            latencies.append(time.perf_counter() - t0)
+            if round_num > 0:
+                continue
+            captchas_correct += answer == label
+            if answer != label:
+                failures.append({"file": file_name, "label": label, "answer": answer})
+            for i, char in enumerate(label):
+                ok = i < len(answer) and answer[i] == char and len(answer) == len(label)
+                digits_total += 1
+                digits_correct += ok
+                per_digit[char][0] += ok
+                per_digit[char][1] += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "commit": git_commit(),
+        "samples": len(samples),
+        "rounds": rounds,
+        "solves_per_sec": round(len(latencies) / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "latency_mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "captcha_accuracy": round(captchas_correct / len(samples), 4),
+        "digit_accuracy": round(digits_correct / digits_total, 4),
+        "per_digit_accuracy": {
+            digit: round(correct / total, 4) if total else None
+            for digit, (correct, total) in per_digit.items()
+        },
+        "failures": failures,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def collect(count: int, corpus_path: Path) -> None:
+    # saves live NCA captchas as <solver_answer>_unverified_<n>.png;
+    # check every image by eye and rename it to <true_answer>_<n>.png
+    import aiohttp
+
+    from app import constants, utils
+
+    corpus_path.mkdir(exist_ok=True)
+    async with aiohttp.ClientSession() as session:
+        for n in range(count):
+            img_data, _ = await utils.get_captcha(session, constants.NCA_API_URL)
+            if not img_data:
+                continue
+            answer = captcha.resolve_captcha(img_data) or "x"
+            file_path = corpus_path / f"{answer}_unverified_{time.time_ns()}.png"
+            file_path.write_bytes(base64.b64decode(img_data))
+            print(f"{n + 1}/{count}: {file_path.name}")
+
+
+def synthesize(count: int, corpus_path: Path, seed: int) -> None:
+    # captchas rendered from the digit templates: random length, font per digit,
+    # spacing, vertical offset and speckle noise; same seed - same files.
+    # The solver matches the same templates, so this only checks that nothing
+    # is broken; accuracy is measured on live captchas (corpus_dir)
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    all_templates = captcha.templates()
+    fonts = {}
+    for digit, template in zip(captcha.template_digits.tolist(), all_templates):
+        fonts.setdefault(digit, []).append(template)
+    corpus_path.mkdir(exist_ok=True)
+    for n in range(count):
+        length = int(rng.choice(captcha.CAPTCHA_LENGTHS))
+        answer = "".join(str(digit) for digit in rng.integers(0, 10, length))
+        glyphs = [fonts[int(char)][rng.integers(2)] for char in answer]
+        gaps = rng.integers(0, 4, length)
+        width = sum(glyph.shape[1] for glyph in glyphs) + int(gaps.sum()) + 10
+        img = np.zeros((45, width, 4), dtype=np.uint8)
+        x = 5
+        for glyph, gap in zip(glyphs, gaps):
+            height, glyph_width = glyph.shape
+            y = int(rng.integers(5, 45 - height + 1))
+            ink = glyph < 250
+            img[y : y + height, x : x + glyph_width, :3][ink] = glyph[ink, None]
+            img[y : y + height, x : x + glyph_width, 3][ink] = 255
+            x += glyph_width + int(gap)
+        specks = rng.random(img.shape[:2]) < 0.003
+        img[specks] = (0, 0, 0, 255)
+        file_path = corpus_path / f"{answer}_synth_{n:04}.png"
+        file_path.write_bytes(cv2.imencode(".png", img)[1].tobytes())
+    print(f"{count} captchas written to {corpus_path}")
+
+
+def print_report(report: dict) -> None:
+    print(f"commit:            {report['commit']}")
+    print(f"samples x rounds:  {report['samples']} x {report['rounds']}")
+    print(f"solves/sec:        {report['solves_per_sec']}")
+    print(f"latency p50/p99:   {report['latency_p50_ms']} / {report['latency_p99_ms']} ms")
+    print(f"captcha accuracy:  {report['captcha_accuracy']:.2%}")
+    print(f"digit accuracy:    {report['digit_accuracy']:.2%}")
+    for digit, accuracy in report["per_digit_accuracy"].items():
+        print(f"  digit {digit}: {'-' if accuracy is None else f'{accuracy:.2%}'}")
+    for failure in report["failures"]:
+        print(f"FAIL {failure['file']}: expected {failure['label']}, got {failure['answer']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Captcha solver benchmark")
+    parser.add_argument(
+        "--corpus", type=Path, help=f"default: {corpus_dir} ({smoke_dir} for --smoke)"
+    )
+    parser.add_argument("--smoke", action="store_true", help="use synthetic captchas")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--json", type=Path, help="save report to JSON file")
+    parser.add_argument("--collect", type=int, metavar="N", help="fetch N captchas")
+    parser.add_argument(
+        "--synthesize", type=int, metavar="N", help="render N captchas from templates"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="seed for --synthesize")
+    args = parser.parse_args()
+    if args.corpus is None:
+        args.corpus = smoke_dir if args.smoke or args.synthesize else corpus_dir
+    if args.collect:
+        asyncio.run(collect(args.collect, args.corpus))
+    elif args.synthesize:
+        synthesize(args.synthesize, args.corpus, args.seed)
+    else:
+        samples = load_corpus(args.corpus)
+        if not samples:
+            parser.error(
+                f"no verified captchas found in {args.corpus}: add some with "
+                "--collect, or run the synthetic smoke test with --smoke"
+            )
+        report = run_bench(samples, args.rounds)
+        print_report(report)
+        if args.json:
+            args.json.write_text(ujson.dumps(report, indent=2))
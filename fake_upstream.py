@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import base64
+import random
+import secrets
+from datetime import date
+from html import escape
+
+import cv2
+import numpy as np
+from aiohttp import web
+
+from app import captcha, utils
+
+POSTKZ_PATH = "/mail-app/api/checkIinBin"
+NCA_PATH = "/service/pkiorder/create.xhtml"
+FIRST_NAMES = ("ИВАН", "АННА", "ПЁТР", "МАРИЯ", "ОЛЕГ", "ЕЛЕНА", "ДМИТРИЙ", "ОЛЬГА")
+LAST_NAMES = ("ИВАНОВ", "ПЕТРОВ", "СИДОРОВ", "КУЗНЕЦОВ", "СМИРНОВ", "ПОПОВ")
+MIDDLE_NAMES = ("ИВАНОВИЧ", "ПЕТРОВНА", "", "СЕРГЕЕВИЧ", "АНДРЕЕВНА")
+
+
+class Population:
+    # synthetic IIN owners, generated deterministically per (date, digit_8th)
+    def __init__(self, seed: int, mean_issued: int, kgd_share: float) -> None:
+        self.seed = seed
+        self.mean_issued = mean_issued
+        self.kgd_share = kgd_share
+        self.owners: dict[str, dict] = {}
+        self.generated: set[str] = set()
+
+    def owner(self, iin: str) -> dict | None:
+        prefix = iin[:8]
+        if prefix not in self.generated:
+            self.generate(prefix)
+        return self.owners.get(iin)
+
+    def generate(self, prefix: str) -> None:
+        self.generated.add(prefix)
+        rng = random.Random(f"{self.seed}:{prefix}")
+        year = int(prefix[:2])
+        try:
+            birth_date = date(
+                year + (2000 if year < 50 else 1900), int(prefix[2:4]), int(prefix[4:6])
+            )
+        except ValueError:
+            return None
+        last_suffix = min(998, int(rng.expovariate(1 / self.mean_issued)))
+        candidates = utils.generate_iins(
+            birth_date, digit_8th=int(prefix[7]), quantity=last_suffix + 1
+        )
+        for iin in candidates:
+            self.owners[iin] = {
+                "last_name": rng.choice(LAST_NAMES),
+                "first_name": rng.choice(FIRST_NAMES),
+                "middle_name": rng.choice(MIDDLE_NAMES),
+                # the most recently issued IINs are often not in KGD base yet
+                "in_kgd": rng.random() < self.kgd_share and iin != candidates[-1],
+            }
+
+
+class Faults:
+    def __init__(
+        self,
+        latency_ms: float,
+        jitter_ms: float,
+        error_rate: float,
+        max_concurrency: int,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0}
+
+    async def __aenter__(self) -> str | None:
+        # returns "throttled" / "error" / None (normal answer)
+        self.stats["requests"] += 1
+        self.in_flight += 1
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        if self.max_concurrency and self.in_flight > self.max_concurrency:
+            self.stats["throttled"] += 1
+            return "throttled"
+        if random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return "error"
+        return None
+
+    async def __aexit__(self, *exc) -> None:
+        self.in_flight -= 1
+
+
+def render_captcha(answer: str) -> bytes:
+    # digit templates on a transparent background, like the real NCA captcha
+    all_templates = captcha.templates()
+    templates = dict(zip(captcha.template_digits.tolist(), all_templates))
+    width = sum(templates[int(char)].shape[1] for char in answer) + 10
+    img = np.zeros((45, width, 4), dtype=np.uint8)
+    x = 5
+    for char in answer:
+        template = templates[int(char)]
+        height, tpl_width = template.shape
+        img[5 : 5 + height, x : x + tpl_width, :3] = template[..., None]
+        img[5 : 5 + height, x : x + tpl_width, 3] = np.where(template < 250, 255, 0)
+        x += tpl_width
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+def partial_response(form_html: str) -> str:
+    return (
+        "<?xml version='1.0' encoding='UTF-8'?>\n"
+        '<partial-response id="j_id1"><changes><update id="indexForm"><![CDATA['
+        f'<form id="indexForm">{form_html}</form>'
+        "]]></update></changes></partial-response>"
+    )
+
+
+def alert_html(text: str) -> str:
+    return f'<ul><li role="alert"><span>{escape(text)}</span></li></ul>'
+
+
+def make_app(population: Population, postkz: Faults, nca: Faults) -> web.Application:
+    sessions: dict[str, dict[str, str]] = {}  # cookie -> {viewstate: captcha answer}
+
+    async def postkz_check(request: web.Request) -> web.Response:
+        async with postkz as fault:
+            if fault == "throttled":
+                return web.json_response({"error": "Too many requests"}, status=429)
+            if fault == "error":
+                return web.json_response({"error": "Internal error"}, status=500)
+            iin = (await request.json()).get("iinBin", "")
+            owner = population.owner(iin)
+            if owner and owner["in_kgd"]:
+                fio = f"{owner['first_name']} {owner['last_name'][0]}"
+                return web.json_response(
+                    {"fio": fio, "correctDt": "2024-01-15 10:00:00"}, status=202
+                )
+            return web.json_response({"error": "Not found"}, status=400)
+
+    async def nca_form(request: web.Request) -> web.Response:
+        async with nca as fault:
+            if fault:
+                return web.Response(status=503 if fault == "throttled" else 500)
+            session_id = request.cookies.get("JSESSIONID") or secrets.token_hex(8)
+            views = sessions.setdefault(session_id, {})
+            viewstate = f"{random.getrandbits(63)}:{random.getrandbits(63)}"
+            answer = "".join(random.choices("0123456789", k=5))
+            views[viewstate] = answer
+            while len(views) > 15:  # JSF keeps a limited number of views per session
+                views.pop(next(iter(views)))
+            img_b64 = base64.b64encode(render_captcha(answer)).decode()
+            page = (
+                '<html><body><form id="indexForm">'
+                f'<span id="captchaImage"><img src="data:image/png;base64,{img_b64}"/>'
+                '</span><input type="hidden" name="javax.faces.ViewState" '
+                f'id="j_id1:javax.faces.ViewState:0" value="{viewstate}"/>'
+                "</form></body></html>"
+            )
+            response = web.Response(text=page, content_type="text/html")
+            response.set_cookie("JSESSIONID", session_id)
+            return response
+
+    async def nca_check(request: web.Request) -> web.Response:
+        async with nca as fault:
+            if fault:
+                return web.Response(status=503 if fault == "throttled" else 500)
+            form = await request.post()
+            views = sessions.get(request.cookies.get("JSESSIONID", ""), {})
+            answer = views.pop(form.get("javax.faces.ViewState", ""), None)
+            if answer is None:  # expired view: no indexForm update at all
+                return web.Response(
+                    text="<partial-response><changes/></partial-response>",
+                    content_type="text/xml",
+                )
+            if form.get("captcha") != answer:
+                form_html = alert_html("Неверно введен код с картинки")
+            elif owner := population.owner(form.get("rcfield:0:inputValue", "")):
+                form_html = "".join(
+                    f'<span class="{class_name}">{escape(owner[key])}</span>'
+                    for class_name, key in (
+                        ("lastname", "last_name"),
+                        ("firstname", "first_name"),
+                        ("middlename", "middle_name"),
+                    )
+                )
+            else:
+                form_html = alert_html("Данные по указанному ИИН не найдены")
+            return web.Response(
+                text=partial_response(form_html), content_type="text/xml"
+            )
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response({"postkz": postkz.stats, "nca": nca.stats})
+
+    app = web.Application()
+    app.router.add_post(POSTKZ_PATH, postkz_check)
+    app.router.add_get(NCA_PATH, nca_form)
+    app.router.add_post(NCA_PATH, nca_check)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for post.kz and NCA")
+    parser.add_argument("--host", default="localhost")  # aiohttp ignores IP cookies
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mean-issued", type=int, default=60, help="IINs per date")
+    parser.add_argument("--kgd-share", type=float, default=0.9)
+    parser.add_argument("--postkz-latency-ms", type=float, default=150)
+    parser.add_argument("--postkz-jitter-ms", type=float, default=50)
+    parser.add_argument("--postkz-error-rate", type=float, default=0.0)
+    parser.add_argument("--postkz-max-concurrency", type=int, default=0)
+    parser.add_argument("--nca-latency-ms", type=float, default=400)
+    parser.add_argument("--nca-jitter-ms", type=float, default=150)
+    parser.add_argument("--nca-error-rate", type=float, default=0.0)
+    parser.add_argument("--nca-max-concurrency", type=int, default=0)
+    args = parser.parse_args()
+    population = Population(args.seed, args.mean_issued, args.kgd_share)
+    postkz = Faults(
+        args.postkz_latency_ms,
+        args.postkz_jitter_ms,
+        args.postkz_error_rate,
+        args.postkz_max_concurrency,
+    )
+    nca = Faults(
+        args.nca_latency_ms,
+        args.nca_jitter_ms,
+        args.nca_error_rate,
+        args.nca_max_concurrency,
+    )
+    base_url = f"http://{args.host}:{args.port}"
+    print("Point the bot at this server with:")
+    print(f"POSTKZ_API_URL={base_url}{POSTKZ_PATH}")
+    print(f"NCA_API_URL={base_url}{NCA_PATH}")
+    web.run_app(make_app(population, postkz, nca), host=args.host, port=args.port)
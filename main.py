@@ -3,7 +3,7 @@ from aiogram import Dispatcher
 
 from bot_instance import bot
 from app.handlers import router
-from app import auto, databases as db
+from app import auto, captcha, maintenance, upstream, utils, databases as db
 
 
 async def run_dispatcher() -> None:
@@ -14,17 +14,24 @@ async def run_dispatcher() -> None:
 
 
 async def main():
+    await db.open_databases()
     await db.create_databases()
+    captcha.start_pool()
+    upstream.start()
     async_tasks = [
         asyncio.create_task(run_dispatcher()),
         asyncio.create_task(auto.send_db_archive(repeat_minutes=60*24)),
-        asyncio.create_task(db.cleanup_log_db(repeat_minutes=60)),
-        asyncio.create_task(db.cleanup_auto_search_db(repeat_minutes=60)),
-        asyncio.create_task(db.cleanup_cache_level1(repeat_minutes=10)),
-        asyncio.create_task(db.cleanup_cache_level2(repeat_minutes=1)),
+        asyncio.create_task(maintenance.run()),
         asyncio.create_task(auto.search(repeat_minutes=1)),
     ]
-    return await asyncio.gather(*async_tasks)
+    try:
+        return await asyncio.gather(*async_tasks)
+    finally:
+        # token workers solve captchas: stop them before the captcha pool
+        await utils.nca_tokens.close()
+        captcha.stop_pool()
+        await upstream.close()
+        await db.close_databases()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+import argparse
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from app import nca_parser
+
+fixtures_dir = Path("nca_fixtures")
+
+
+def bs_parse_form_page(page: str) -> tuple[str, str]:
+    # reference: BeautifulSoup path used by utils.get_captcha before nca_parser
+    soup = BeautifulSoup(markup=page, features="html.parser")
+    img_src = soup.find(name="span", id="captchaImage").find("img")["src"]
+    img_data = img_src.removeprefix("data:image/png;base64,")
+    viewstate = soup.find(name="input", id="j_id1:javax.faces.ViewState:0")["value"]
+    return img_data, viewstate
+
+
+def bs_parse_check_response(xml: str) -> dict:
+    # reference: BeautifulSoup path used by utils.update_iin_nca before nca_parser
+    xml_soup = BeautifulSoup(xml, "xml")
+    html = xml_soup.find("update", id="indexForm").string
+    html_soup = BeautifulSoup(html, "html.parser")
+    alert = html_soup.find("li", role="alert")
+    if alert:
+        return {"alert": alert.get_text()}
+    return {
+        "alert": None,
+        "last_name": html_soup.find("span", class_="lastname").string,
+        "first_name": html_soup.find("span", class_="firstname").string,
+        "middle_name": html_soup.find("span", class_="middlename").string,
+    }
+
+
+def load_fixtures() -> list[tuple]:
+    fixtures = []
+    for file_path in sorted(fixtures_dir.glob("*.html")):
+        fixtures.append(
+            (
+                file_path.name,
+                file_path.read_text(encoding="utf-8"),
+                bs_parse_form_page,
+                nca_parser.parse_form_page,
+            )
+        )
+    for file_path in sorted(fixtures_dir.glob("*.xml")):
+        fixtures.append(
+            (
+                file_path.name,
+                file_path.read_text(encoding="utf-8"),
+                bs_parse_check_response,
+                nca_parser.parse_check_response,
+            )
+        )
+    return fixtures
+
+
+def timed(parse, markup: str, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        parse(markup)
+    return (time.perf_counter() - started) / rounds * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NCA response parser benchmark")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    mismatches = 0
+    print(f"{'fixture':<30} {'bs4, ms':>10} {'lxml, ms':>10} {'speedup':>8}")
+    for name, markup, bs_parse, lxml_parse in load_fixtures():
+        expected, result = bs_parse(markup), lxml_parse(markup)
+        if expected != result:
+            mismatches += 1
+            print(f"MISMATCH {name}: bs4={expected!r} lxml={result!r}")
+        bs_ms = timed(bs_parse, markup, args.rounds)
+        lxml_ms = timed(lxml_parse, markup, args.rounds)
+        print(f"{name:<30} {bs_ms:>10.3f} {lxml_ms:>10.3f} {bs_ms / lxml_ms:>7.1f}x")
+    if mismatches:
+        raise SystemExit(f"{mismatches} fixture(s) parsed differently")
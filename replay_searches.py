@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import ujson
+
+
+def load_workload(log_file: Path, since: str, until: str, limit: int) -> list[dict]:
+    with sqlite3.connect(log_file) as db_connection:
+        rows = db_connection.execute(
+            """SELECT date_time, search_date, search_name, digit_8th, auto_search,
+                cache_used
+                FROM searches
+                WHERE date_time >= ? AND date_time < ?
+                ORDER BY date_time
+                LIMIT ?""",
+            (since, until, limit),
+        ).fetchall()
+    keys = ("date_time", "search_date", "name", "digit_8th", "auto", "cache_used")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def scale_workload(workload: list[dict], speed: float, copies: int) -> list[dict]:
+    # copies of a search get shifted birth dates, so a simulated spike of new
+    # users is not coalesced into the original searches
+    if not workload:
+        return []
+    started = datetime.fromisoformat(workload[0]["date_time"])
+    scaled = []
+    for search in workload:
+        logged_at = datetime.fromisoformat(search["date_time"])
+        offset = (logged_at - started).total_seconds()
+        for copy_num in range(copies):
+            birth_date = date.fromisoformat(search["search_date"])
+            scaled.append(
+                {
+                    **search,
+                    "at": offset / speed,
+                    "birth_date": birth_date + timedelta(days=copy_num),
+                }
+            )
+    return sorted(scaled, key=lambda search: search["at"])
+
+
+async def run_search(search: dict, started: float, results: list[dict]) -> None:
+    from app import utils
+
+    await asyncio.sleep(max(0.0, started + search["at"] - time.monotonic()))
+    name = search["name"].casefold()
+    t0 = time.monotonic()
+    result = {"auto": search["auto"], "logged_cache_used": search["cache_used"]}
+    try:
+        if search["auto"]:
+            # auto-search tasks keep no candidate list in the log: start from
+            # the first candidates and let extend_auto_search add the rest
+            iins_auto_search = [
+                {"iin": iin}
+                for iin in utils.generate_iins(
+                    search["birth_date"], search["digit_8th"], quantity=10
+                )
+            ]
+            iins_found, _, _ = await utils.find_iin_auto(
+                iins_auto_search, name, search["birth_date"]
+            )
+            result["cache_used"] = 0
+        else:
+            result["cache_used"], iins_found, _ = await utils.find_iin(
+                search["birth_date"], name, search["digit_8th"]
+            )
+        result["found"] = len(iins_found)
+    except Exception as err:
+        print(f"*** ERROR: run_search - {err!r}")
+        result["error"] = repr(err)
+    result["latency"] = time.monotonic() - t0
+    results.append(result)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, round(pct / 100 * (len(values) - 1)))]
+
+
+async def replay(workload: list[dict], concurrency_report: float) -> dict:
+    from app import captcha, upstream, utils, databases as db
+
+    await db.open_databases()
+    await db.create_databases()
+    upstream.start()
+    results = []
+    started = time.monotonic()
+    tasks = [
+        asyncio.create_task(run_search(search, started, results)) for search in workload
+    ]
+    while not all(task.done() for task in tasks):
+        await asyncio.sleep(concurrency_report)
+        done = sum(task.done() for task in tasks)
+        print(
+            f"[{time.monotonic() - started:7.1f}s] done {done}/{len(tasks)}, "
+            f"upstream {dict(utils.upstream_calls)}, "
+            f"limiter {utils.postkz_limiter.stats()}"
+        )
+    elapsed = time.monotonic() - started
+    await utils.nca_tokens.close()
+    await upstream.close()
+    captcha.stop_pool()
+    await db.close_databases()
+    latencies = [result["latency"] for result in results]
+    manual = [result for result in results if not result["auto"]]
+    cache_used = Counter(result.get("cache_used") for result in manual)
+    logged_cache_used = Counter(result["logged_cache_used"] for result in manual)
+    return {
+        "searches": len(results),
+        "errors": sum("error" in result for result in results),
+        "elapsed_sec": round(elapsed, 1),
+        "throughput_per_min": round(len(results) / elapsed * 60, 2),
+        "latency_p50_sec": round(percentile(latencies, 50), 2),
+        "latency_p90_sec": round(percentile(latencies, 90), 2),
+        "latency_p99_sec": round(percentile(latencies, 99), 2),
+        "latency_mean_sec": round(statistics.fmean(latencies), 2),
+        "cache_used": {str(level): cache_used[level] for level in (0, 1, 2)},
+        "logged_cache_used": {
+            str(level): logged_cache_used[level] for level in (0, 1, 2)
+        },
+        "memory_cache": db.cache_stats(),
+        "upstream_calls": dict(utils.upstream_calls),
+        "postkz_calls_per_search": round(
+            utils.upstream_calls["postkz"] / max(1, len(results)), 1
+        ),
+        "nca_checks_per_search": round(
+            utils.upstream_calls["nca_check"] / max(1, len(results)), 1
+        ),
+    }
+
+
+def use_data_dir(data_dir: Path) -> None:
+    # replay must never write into the production cache and logs
+    from app import databases as db
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    db.cache_db_file = data_dir / "cache.db"
+    db.search_log_db_file = data_dir / "search_log.db"
+    db.auto_search_db_file = data_dir / "auto_search.db"
+    db.access_db_file = data_dir / "access.db"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay logged searches")
+    parser.add_argument(
+        "--log", type=Path, default=Path("app", "data", "search_log.db")
+    )
+    parser.add_argument("--since", default="0000-01-01 00:00:00")
+    parser.add_argument("--until", default="9999-12-31 23:59:59")
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--speed", type=float, default=60.0, help="time compression")
+    parser.add_argument("--copies", type=int, default=1, help="spike multiplier")
+    parser.add_argument("--postkz-url", help="overrides POSTKZ_API_URL")
+    parser.add_argument("--nca-url", help="overrides NCA_API_URL")
+    parser.add_argument("--data-dir", type=Path, default=Path("replay_data"))
+    parser.add_argument("--keep-cache", action="store_true")
+    parser.add_argument("--report-every", type=float, default=10.0)
+    parser.add_argument("--json", type=Path, help="save report to JSON file")
+    args = parser.parse_args()
+    # URLs are read by app.constants at import time
+    if args.postkz_url:
+        os.environ["POSTKZ_API_URL"] = args.postkz_url
+    if args.nca_url:
+        os.environ["NCA_API_URL"] = args.nca_url
+    if not args.keep_cache:
+        for db_file in args.data_dir.glob("*.db"):
+            db_file.unlink()
+    use_data_dir(args.data_dir)
+    workload = scale_workload(
+        load_workload(args.log, args.since, args.until, args.limit),
+        args.speed,
+        args.copies,
+    )
+    if not workload:
+        parser.error("no searches in the selected window")
+    print(
+        f"Replaying {len(workload)} searches over "
+        f"{workload[-1]['at']:.0f}s (speed x{args.speed}, copies x{args.copies})"
+    )
+    report = asyncio.run(replay(workload, args.report_every))
+    for key, value in report.items():
+        print(f"{key:<26} {value}")
+    if args.json:
+        args.json.write_text(ujson.dumps(report, indent=2))